@@ -0,0 +1,260 @@
+"""
+Offline benchmark for trigger matching. No network, no bot token needed.
+
+    python bench_matcher.py                      # compare matchers on a generated corpus
+    python bench_matcher.py --e2e                # also run main.check_text on fake updates
+    python bench_matcher.py --alloc --messages 2000
+    python bench_matcher.py --memory classic.csv winter.csv  # what each pack keeps in memory
+
+The corpus is built from stickers.csv: room-link messages that hit a trigger (every
+language in the file), messages with a link but no tree name, and messages without a
+link, each in a short and a long form. Each message sticks to one language unless
+--mixed is given.
+"""
+import argparse
+import asyncio
+import csv
+import gc
+import marshal
+import random
+import re
+import time
+import tracemalloc
+import types
+from datetime import datetime, timezone
+from matcher import TriggerMatcher, trigger_scripts
+from trigger_index import TriggerIndex
+
+LINK = "https://forestapp.cc/join-room?token=bench{n}"
+# Filler words by script; messages use the script of their group unless --mixed is given
+FILLER = {
+    "latin": ["join", "me", "planting", "let's", "focus", "together", "now", "🌲", "📚"],
+    "arabic": ["تعال", "نزرع", "معا", "الآن", "🌲"],
+    "cjk": ["一起", "种树", "一緒に", "集中", "🌲"],
+    "cyrillic": ["давай", "сажать", "вместе", "сейчас", "🌲"],
+    "thai": ["ปลูก", "ด้วยกัน", "ตอนนี้", "🌲"],
+    "hangul": ["같이", "심어요", "지금", "🌲"],
+}
+ALL_FILLER = [word for words in FILLER.values() for word in words]
+
+
+def load_rows(path):
+    with open(path, mode="r", encoding="utf-8") as file:
+        return [(row[0].strip(), row[1].strip()) for row in csv.reader(file) if len(row) == 2]
+
+
+def make_corpus(rows, size, seed=0, mixed=False):
+    """
+    Returns [(kind, text)] with an even mix of hits, misses and no-link messages, short and long.
+    Each message is written in one language, like in a real group (the filler matches the script
+    of the trigger it hides); with mixed=True every message mixes all of them.
+    """
+    rng = random.Random(seed)
+    triggers = [trigger for trigger, _ in rows]
+    kinds = ["hit", "miss", "no_link"]
+    corpus = []
+    for n in range(size):
+        kind = kinds[n % len(kinds)]
+        length = "long" if (n // len(kinds)) % 2 else "short"
+        trigger = rng.choice(triggers)
+        scripts = [script for script in trigger_scripts(trigger) if script in FILLER] or ["latin"]
+        filler = ALL_FILLER if mixed else FILLER[scripts[-1]]
+        words = rng.choices(filler, k=40 if length == "long" else 3)
+        if kind == "hit":
+            words.insert(rng.randrange(len(words) + 1), trigger)
+        if kind != "no_link":
+            words.insert(rng.randrange(len(words) + 1), LINK.format(n=n))
+        corpus.append((f"{kind}_{length}", " ".join(words)))
+    return corpus
+
+
+# --- Matcher implementations: each takes the CSV rows and returns search(text) -> sticker ID or None ---
+
+def build_regex(rows):
+    """The original loop: one compiled regex per trigger, longest first."""
+    ordered = sorted(rows, key=lambda item: len(item[0]), reverse=True)
+    triggers = {trigger: sticker_id for trigger, sticker_id in ordered}
+    patterns = [
+        (re.compile(rf"(?<!\S){re.escape(trigger)}(?!\S)", re.IGNORECASE), sticker_id)
+        for trigger, sticker_id in triggers.items()
+    ]
+
+    def search(text):
+        for pattern, sticker_id in patterns:
+            if pattern.search(text):
+                return sticker_id
+        return None
+
+    return search
+
+
+def build_aho_corasick(rows):
+    """One automaton over every trigger."""
+    ordered = sorted(rows, key=lambda item: len(item[0]), reverse=True)
+    triggers = {trigger: sticker_id for trigger, sticker_id in ordered}
+    matcher = TriggerMatcher(triggers)
+
+    def search(text):
+        trigger = matcher.search(text)
+        return None if trigger is None else triggers[trigger]
+
+    return search
+
+
+def build_script_buckets(rows):
+    """What the bot uses: script buckets, CJK triggers only scanned when the message has CJK text."""
+    return TriggerIndex(rows).search
+
+
+MATCHERS = {
+    "regex": build_regex,
+    "aho-corasick": build_aho_corasick,
+    "script-buckets": build_script_buckets,
+}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def report(name, latencies, extra=""):
+    latencies.sort()
+    total = sum(latencies)
+    print(
+        f"{name:<28} {len(latencies) / total:>10,.0f} msg/s   "
+        f"p50 {percentile(latencies, 0.50) * 1e6:>8.1f} µs   "
+        f"p99 {percentile(latencies, 0.99) * 1e6:>8.1f} µs{extra}"
+    )
+
+
+def bench_matcher(name, build, rows, corpus, alloc):
+    started = time.perf_counter()
+    search = build(rows)
+    search(corpus[0][1])  # anything built lazily is built now
+    build_ms = (time.perf_counter() - started) * 1000
+
+    by_kind = {}
+    latencies = []
+    for kind, text in corpus:
+        before = time.perf_counter()
+        search(text)
+        elapsed = time.perf_counter() - before
+        latencies.append(elapsed)
+        by_kind.setdefault(kind, []).append(elapsed)
+
+    extra = f"   build {build_ms:.0f} ms"
+    if alloc:
+        tracemalloc.start()
+        for _, text in corpus:
+            search(text)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        extra += f"   peak alloc {peak / 1024:.1f} KiB"
+
+    report(name, latencies, extra)
+    for kind in sorted(by_kind):
+        report(f"  {kind}", by_kind[kind])
+
+
+def memory_report(path):
+    """What one pack keeps allocated once loaded, part by part, measured with tracemalloc."""
+    def used():
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.start()
+    before = used()
+    index = TriggerIndex.from_csv(path)
+    table = used()
+    index.compile()
+    matcher = used()
+    index.fuzzy_index()
+    fuzzy = used()
+    state = marshal.dumps(index.to_state())
+    stickers = len({sticker_id for _, sticker_id in index.items()})
+    del index
+    unloaded = used()
+    index = TriggerIndex.from_state(marshal.loads(state))
+    loaded = used()
+    tracemalloc.stop()
+
+    print(f"🧠 {path}: {len(index)} triggers, {stickers} stickers")
+    print(
+        f"   table {(table - before) / 1024:.0f} KiB   matcher {(matcher - table) / 1024:.0f} KiB   "
+        f"fuzzy index {(fuzzy - matcher) / 1024:.0f} KiB (only with FUZZY_MATCH)"
+    )
+    print(f"   from the snapshot: {(loaded - unloaded) / 1024:.0f} KiB ({len(state) / 1024:.0f} KiB on disk)")
+
+
+def fake_update(text, n, replies):
+    async def reply_sticker(sticker, disable_notification=False):
+        replies.append(sticker)
+
+    message = types.SimpleNamespace(
+        text=text,
+        date=datetime.now(timezone.utc),
+        from_user=types.SimpleNamespace(id=n),  # a new user each time, so the cooldown never kicks in
+        forward_origin=None,
+        sender_chat=None,
+        reply_sticker=reply_sticker,
+    )
+    return types.SimpleNamespace(
+        effective_message=message,
+        message=message,
+        channel_post=None,
+        effective_chat=types.SimpleNamespace(id=-100),
+    )
+
+
+async def bench_check_text(corpus):
+    import main as bot
+    from sender import SendScheduler
+
+    bot.setup()
+    # Measure the bot, not Telegram's rate limits
+    unlimited = SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9)
+    unlimited.observe = bot.sender.observe
+    bot.sender = unlimited
+    await bot.sender.start()
+    replies = []
+    updates = [fake_update(text, n, replies) for n, (_, text) in enumerate(corpus)]
+    latencies = []
+    for update in updates:
+        before = time.perf_counter()
+        await bot.check_text(update, None)
+        latencies.append(time.perf_counter() - before)
+    await bot.sender.stop()
+    report("check_text (end to end)", latencies, f"   {len(replies)} replies")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stickers", default="stickers.csv")
+    parser.add_argument("--messages", type=int, default=6000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--matchers", default=",".join(MATCHERS), help="comma separated, from: " + ", ".join(MATCHERS))
+    parser.add_argument("--mixed", action="store_true", help="mix every language into each message")
+    parser.add_argument("--alloc", action="store_true", help="also measure peak allocations (slower)")
+    parser.add_argument("--e2e", action="store_true", help="also run main.check_text on fake updates")
+    parser.add_argument("--memory", nargs="*", metavar="CSV",
+                        help="only report the memory each CSV (default --stickers) takes once loaded")
+    args = parser.parse_args()
+
+    if args.memory is not None:
+        for path in args.memory or [args.stickers]:
+            memory_report(path)
+        return
+
+    rows = load_rows(args.stickers)
+    corpus = make_corpus(rows, args.messages, args.seed, args.mixed)
+    print(f"📊 {len(rows)} triggers, {len(corpus)} messages\n")
+
+    for name in args.matchers.split(","):
+        bench_matcher(name, MATCHERS[name], rows, corpus, args.alloc)
+
+    if args.e2e:
+        asyncio.run(bench_check_text(corpus))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Startup benchmark: where import time goes, and how long the bot takes to reach its first
+getUpdates call. No network, no bot token needed.
+
+    python bench_startup.py                  # import breakdown + time to first getUpdates
+    python bench_startup.py --runs 10 --cold # without a trigger snapshot (first start after a CSV change)
+
+The bot runs against fake_bot_api in a temporary folder with copies of the sticker CSVs,
+so the real .trigger_cache and schedules.json are left alone.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bench_matcher import percentile
+from fake_bot_api import FakeBotApi, start_fake_api
+from trigger_index import load_cached
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_breakdown(workdir, env, top=12):
+    """[(module, cumulative µs)] of what `import main` imports directly, slowest first, plus main's own time."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    modules = []
+    own = total = 0
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), len(match[3]), match[4]
+        if name == "main":
+            own, total = self_us, cumulative_us
+        elif indent == 3:  # imported by main itself
+            modules.append((name, cumulative_us))
+    modules.sort(key=lambda item: -item[1])
+    return modules[:top], own, total
+
+
+class StartupApi(FakeBotApi):
+    """Records when the first getUpdates call comes in."""
+
+    def __init__(self):
+        super().__init__(rate=0, chats=1)
+        self.first_poll = None
+
+    async def get_updates(self, params):
+        if self.first_poll is None:
+            self.first_poll = time.monotonic()
+        return await super().get_updates(params)
+
+
+async def time_to_first_poll(workdir, env, port, timeout=30):
+    api = StartupApi()
+    server = start_fake_api(api, port)
+    env = dict(env, BOT_API_BASE_URL=f"http://127.0.0.1:{port}", PORT=str(port + 1))
+    started = time.monotonic()
+    bot = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "main.py")], cwd=workdir, env=env,
+                           stdout=subprocess.DEVNULL)
+    try:
+        while api.first_poll is None and time.monotonic() - started < timeout and bot.poll() is None:
+            await asyncio.sleep(0.002)
+    finally:
+        bot.terminate()
+        api.closing = True
+        await asyncio.to_thread(bot.wait)
+        server.stop()
+    if api.first_poll is None:
+        raise RuntimeError(f"the bot never polled (exit code {bot.returncode})")
+    return api.first_poll - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cold", action="store_true", help="remove the trigger snapshot before every run")
+    parser.add_argument("--port", type=int, default=8091)
+    args = parser.parse_args()
+
+    env = dict(os.environ, BOT_TOKEN="123456:FAKE", PYTHONPATH=REPO_DIR)
+    with tempfile.TemporaryDirectory() as workdir:
+        for path in glob.glob(os.path.join(REPO_DIR, "*.csv")):
+            shutil.copy(path, workdir)
+        cache_dir = os.path.join(workdir, ".trigger_cache")
+
+        import_breakdown(workdir, env)  # the first run fills the bytecode caches
+        modules, own, total = import_breakdown(workdir, env)
+        print(f"📦 import main: {total / 1000:.1f} ms, {own / 1000:.1f} ms of it in main.py itself")
+        for name, cumulative in modules:
+            print(f"   {cumulative / 1000:7.1f} ms  {name}")
+
+        if not args.cold:
+            # The bot only writes the snapshot once it is polling, so build it here
+            load_cached(os.path.join(workdir, "stickers.csv"), cache_dir)
+        times = []
+        for _ in range(args.runs):
+            if args.cold:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            times.append(asyncio.run(time_to_first_poll(workdir, env, args.port)))
+        times.sort()
+        print(
+            f"🚀 First getUpdates after {percentile(times, 0.5) * 1000:.0f} ms "
+            f"(min {times[0] * 1000:.0f}, max {times[-1] * 1000:.0f}, {args.runs} {'cold' if args.cold else 'warm'} runs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Finds triggers that clash with each other, e.g. an Arabic name shared by two different trees.
+
+    python conflicts.py stickers.csv > conflicts.json
+
+load_cached() writes the same report next to its snapshot whenever a CSV is rebuilt.
+"""
+import json
+import sys
+import unicodedata
+from matcher import fold, is_unbounded
+
+
+def analyze(rows):
+    """
+    Returns a JSON-ready report on `(trigger, sticker_id)` rows, in load order:
+
+    * duplicates: the same trigger on several rows. The last row's sticker is the one used.
+    * collisions: different triggers the matcher can't tell apart ("case", only the first
+      loaded one can ever match, the rest are dead) or that only differ by Unicode
+      normalization ("normalization", e.g. full-width brackets, both still match).
+    * shadowed: a trigger for one sticker that sits inside a longer trigger for another.
+      The longer one wins whenever both are present.
+    * dead: triggers that can never match and are left out of the matcher.
+    """
+    stickers = {}  # trigger -> every sticker it was given, in order
+    for trigger, sticker_id in rows:
+        stickers.setdefault(trigger, []).append(sticker_id)
+    final = {trigger: ids[-1] for trigger, ids in stickers.items()}
+
+    duplicates = [
+        {"trigger": trigger, "stickers": ids, "conflict": len(set(ids)) > 1, "kept": ids[-1]}
+        for trigger, ids in stickers.items()
+        if len(ids) > 1
+    ]
+
+    dead = [trigger for trigger in final if not fold(trigger)]
+    collisions = []
+    by_fold = {}
+    by_norm = {}
+    for trigger in final:
+        if fold(trigger):
+            by_fold.setdefault(fold(trigger), []).append(trigger)
+            by_norm.setdefault(fold(unicodedata.normalize("NFKC", trigger)), []).append(trigger)
+    for group in by_fold.values():
+        if len(group) > 1:
+            # Same folded text means same length, so load order decides: the first one wins
+            collisions.append(_collision("case", group, final, kept=group[0]))
+            dead.extend(group[1:])
+    for group in by_norm.values():
+        distinct = {}  # one trigger per folded text, case collisions are reported above
+        for trigger in group:
+            distinct.setdefault(fold(trigger), trigger)
+        distinct = list(distinct.values())
+        if len(distinct) > 1:
+            collisions.append(_collision("normalization", distinct, final, kept=None))
+
+    return {
+        "triggers": len(final),
+        "duplicates": duplicates,
+        "collisions": collisions,
+        "shadowed": _shadowed(final, set(dead)),
+        "dead": dead,
+    }
+
+
+def _collision(kind, triggers, final, kept):
+    return {
+        "kind": kind,
+        "triggers": triggers,
+        "stickers": [final[trigger] for trigger in triggers],
+        "conflict": len({final[trigger] for trigger in triggers}) > 1,
+        "kept": kept,
+    }
+
+
+def _shadowed(final, dead):
+    bounded = {}  # folded trigger -> trigger, for the ones needing whitespace around them
+    unbounded = {}
+    for trigger in final:
+        if trigger in dead:
+            continue
+        (unbounded if is_unbounded(trigger) else bounded).setdefault(fold(trigger), trigger)
+    longest_unbounded = max(map(len, unbounded), default=0)
+
+    shadowed = []
+    for outer in final:
+        if outer in dead:
+            continue
+        text = fold(outer)
+        inner = set()
+        # Bounded triggers can only sit on word boundaries of the longer one
+        starts = [0] + [i + 1 for i, ch in enumerate(text) if ch.isspace()]
+        ends = [i for i, ch in enumerate(text) if ch.isspace()] + [len(text)]
+        for start in starts:
+            for end in ends:
+                if start < end and end - start < len(text) and text[start:end] in bounded:
+                    inner.add(bounded[text[start:end]])
+        for start in range(len(text)):
+            for end in range(start + 1, min(len(text), start + longest_unbounded) + 1):
+                if end - start < len(text) and text[start:end] in unbounded:
+                    inner.add(unbounded[text[start:end]])
+        for trigger in sorted(inner):
+            if final[trigger] != final[outer]:
+                shadowed.append({
+                    "trigger": trigger, "sticker": final[trigger], "by": outer, "by_sticker": final[outer],
+                })
+    return shadowed
+
+
+def summary(report):
+    """One line for the startup log, or None if there is nothing to report."""
+    conflicting = sum(1 for item in report["duplicates"] + report["collisions"] if item["conflict"])
+    # Shadowing is normal ("cactus" inside "ball cactus"), so it alone isn't worth a warning
+    if not (conflicting or report["dead"]):
+        return None
+    return (
+        f"{conflicting} conflicting duplicates/collisions, {len(report['shadowed'])} shadowed, "
+        f"{len(report['dead'])} dead triggers dropped"
+    )
+
+
+def save_report(report, path):
+    with open(path, mode="w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    from trigger_index import _parse_rows
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else "stickers.csv", mode="r", encoding="utf-8") as file:
+        json.dump(analyze(_parse_rows(file)), sys.stdout, ensure_ascii=False, indent=2)
+    print()
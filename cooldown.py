@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+
+
+class CooldownStore:
+    """
+    Remembers when each key last fired, for at most `ttl` seconds.
+    Entries are kept in last-touched order, so expired ones are always at the front
+    and get dropped a few at a time on each write. `max_entries` is a hard cap:
+    when it is reached the oldest entry is evicted even if it hasn't expired yet.
+    """
+
+    def __init__(self, ttl, max_entries=10_000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_cooling(self, key, now=None):
+        """True if `key` fired less than `ttl` seconds ago."""
+        last = self._entries.get(key)
+        if last is None:
+            return False
+        if now is None:
+            now = self.clock()
+        return now - last < self.ttl
+
+    def touch(self, key, now=None):
+        """Records that `key` fired at `now`."""
+        if now is None:
+            now = self.clock()
+        entries = self._entries
+        entries[key] = now
+        entries.move_to_end(key)
+        self._expire(now)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evicted += 1
+
+    def _expire(self, now):
+        entries = self._entries
+        while entries:
+            oldest = next(iter(entries.values()))
+            if now - oldest < self.ttl:
+                break
+            entries.popitem(last=False)
+            self.expired += 1
+
+    def stats(self):
+        return {"size": len(self._entries), "expired": self.expired, "evicted": self.evicted}
@@ -0,0 +1,147 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+from datetime import datetime, timezone
+from group_commit import file_lock
+from trigger_index import _parse_rows
+
+
+class ExportCache:
+    """
+    Numbered snapshots of the trigger table for /export, kept gzipped in `directory`
+    (the last `keep` of them). A new version is only stored when the content changed,
+    and every document sent for a version remembers the file_id Telegram gave it, so
+    the same file is never uploaded twice. The manifest is shared by all shards, so
+    every change to it is made under file_lock().
+    """
+
+    def __init__(self, directory, keep=20):
+        self.directory = directory
+        self.keep = keep
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.versions = []  # {"version", "sha256", "rows", "at", "stamp", "file_ids"}, oldest first
+
+    def snapshot(self, read, stamp=None):
+        """
+        Returns the version entry for the data `read()` returns (CSV bytes), storing a new
+        version if it differs from the latest one. `stamp` (e.g. the file's size and mtime)
+        lets an unchanged source skip the read and the hashing altogether.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self.manifest_path):
+            return self._snapshot(read, stamp)
+
+    def _snapshot(self, read, stamp):
+        self._load()
+        latest = self.versions[-1] if self.versions else None
+        stamp = list(stamp) if stamp is not None else None
+        if stamp is not None and latest and latest["stamp"] == stamp:
+            return latest
+
+        data = read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        if latest and latest["sha256"] == sha256:
+            latest["stamp"] = stamp
+            self._save()
+            return latest
+
+        entry = {
+            "version": latest["version"] + 1 if latest else 1,
+            "sha256": sha256,
+            "rows": len(_rows(data)),
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "stamp": stamp,
+            "file_ids": {},
+        }
+        with open(self._path(entry["version"]), "wb") as file:
+            file.write(gzip.compress(data, mtime=0))
+        self.versions.append(entry)
+        for old in self.versions[:-self.keep]:
+            try:
+                os.remove(self._path(old["version"]))
+            except FileNotFoundError:
+                pass
+        self.versions = self.versions[-self.keep:]
+        self._save()
+        return entry
+
+    def get(self, version):
+        """Raises KeyError for a version that was never stored or is no longer kept."""
+        self._load()
+        for entry in self.versions:
+            if entry["version"] == version:
+                return entry
+        raise KeyError(version)
+
+    def filename(self, entry, since=None, compress=True):
+        """Name of the document for a full export, or for the delta from version `since`."""
+        name = f"stickers-v{entry['version']}" if since is None else f"stickers-v{since}-v{entry['version']}"
+        return name + (".csv.gz" if compress else ".csv")
+
+    def document(self, entry, compress=True):
+        """Bytes of a full export."""
+        with open(self._path(entry["version"]), "rb") as file:
+            data = file.read()
+        return data if compress else gzip.decompress(data)
+
+    def delta(self, since, entry, compress=True):
+        """
+        (bytes, counts) of the changes from version `since` to `entry`, as
+        `action,trigger,sticker_id` rows: "add", "change" (new sticker) and "remove".
+        Raises KeyError if `since` is not kept.
+        """
+        old = dict(_rows(self._read(self.get(since))))
+        new = dict(_rows(self._read(entry)))
+        changes = []
+        for trigger, sticker_id in new.items():
+            if trigger not in old:
+                changes.append(["add", trigger, sticker_id])
+            elif old[trigger] != sticker_id:
+                changes.append(["change", trigger, sticker_id])
+        changes.extend(["remove", trigger, sticker_id] for trigger, sticker_id in old.items() if trigger not in new)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["action", "trigger", "sticker_id"])
+        writer.writerows(changes)
+        data = buffer.getvalue().encode("utf-8")
+        counts = {action: sum(1 for row in changes if row[0] == action) for action in ("add", "change", "remove")}
+        return (gzip.compress(data, mtime=0) if compress else data), counts
+
+    def remember(self, entry, filename, file_id):
+        """Stores the file_id Telegram returned for a document of this version."""
+        entry["file_ids"][filename] = file_id
+        with file_lock(self.manifest_path):
+            self._load()
+            for current in self.versions:
+                if current["version"] == entry["version"]:
+                    current["file_ids"][filename] = file_id
+                    self._save()
+                    return
+
+    def _read(self, entry):
+        with open(self._path(entry["version"]), "rb") as file:
+            return gzip.decompress(file.read())
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"v{version}.csv.gz")
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, mode="r", encoding="utf-8") as file:
+                self.versions = json.load(file)["versions"]
+        except FileNotFoundError:
+            self.versions = []
+
+    def _save(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as file:
+            json.dump({"versions": self.versions}, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def _rows(data):
+    return _parse_rows(io.StringIO(data.decode("utf-8"), newline=""))
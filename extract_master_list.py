@@ -1,12 +1,42 @@
+import argparse
 import os
+import time
 import xml.etree.ElementTree as ET
 import csv
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 # This regex matches the internal keys Forest uses for trees (e.g., tree_type_0_title)
 REGEX_PATTERN = re.compile(r"tree_type_(\d+)_title")
 
-def extract_all_languages(res_path):
+def lang_code_for(folder):
+    if folder == "values":
+        return "default"
+    # Extract code from 'values-fr', 'values-zh-rTW', etc.
+    return folder.split("-", 1)[1]
+
+def parse_strings(xml_file):
+    """
+    Streams one strings.xml and returns ({key: text} for the tree keys only, seconds taken, error).
+    Runs in a worker process. Every element is cleared as soon as it ends, so memory stays
+    flat no matter how big the file is (clearing a <b> inside a <string> doesn't touch the
+    string's own text, which is all we read).
+    """
+    started = time.perf_counter()
+    found = {}
+    try:
+        for _, elem in ET.iterparse(xml_file):
+            if elem.tag == "string":
+                key = elem.get("name")
+                value = elem.text
+                if key and value and REGEX_PATTERN.match(key):
+                    found[key] = value.strip()
+            elem.clear()
+    except Exception as e:
+        return {}, time.perf_counter() - started, str(e)
+    return found, time.perf_counter() - started, None
+
+def extract_all_languages(res_path, jobs=None):
     # Dictionary structure: { 'tree_type_0_title': { 'default': 'Cedar', 'fr': 'Cèdre', ... } }
     data = {}
     
@@ -15,45 +45,46 @@ def extract_all_languages(res_path):
     all_languages.add('default') # English is usually in the default 'values' folder
 
     print(f"📂 Scanning folders in: {res_path}")
+    started = time.perf_counter()
 
-    # 1. Walk through every folder in the 'res' directory
+    # 1. Find every 'values*' folder in the 'res' directory
+    files = {}  # lang code -> (folder, strings.xml path)
     for folder in os.listdir(res_path):
         folder_path = os.path.join(res_path, folder)
-        
-        # We only care about folders starting with 'values'
         if os.path.isdir(folder_path) and folder.startswith("values"):
-            
-            # Determine the language code
-            if folder == "values":
-                lang_code = "default"
-            else:
-                # Extract code from 'values-fr', 'values-zh-rTW', etc.
-                lang_code = folder.split("-", 1)[1]
-            
+            lang_code = lang_code_for(folder)
             all_languages.add(lang_code)
-            
-            # 2. Parse the strings.xml file inside
             xml_file = os.path.join(folder_path, "strings.xml")
             if os.path.exists(xml_file):
-                try:
-                    tree = ET.parse(xml_file)
-                    root = tree.getroot()
-                    
-                    for string_elem in root.findall('string'):
-                        key = string_elem.get('name')
-                        value = string_elem.text
-                        
-                        if key and value and REGEX_PATTERN.match(key):
-                            if key not in data:
-                                data[key] = {}
-                            # Save the translation
-                            data[key][lang_code] = value.strip()
-                            
-                except Exception as e:
-                    print(f"⚠️ Could not parse {folder}: {e}")
+                files[lang_code] = (folder, xml_file)
+    scanned = time.perf_counter()
+
+    # 2. Parse the strings.xml files in parallel
+    timings = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(parse_strings, [xml_file for _, xml_file in files.values()], chunksize=8)
+        for (lang_code, (folder, xml_file)), (found, seconds, error) in zip(files.items(), results):
+            if error:
+                print(f"⚠️ Could not parse {folder}: {error}")
+            for key, value in found.items():
+                data.setdefault(key, {})[lang_code] = value
+            timings.append((seconds, folder, os.path.getsize(xml_file)))
+    parsed = time.perf_counter()
 
+    report_timings(timings, scanned - started, parsed - scanned)
     return data, sorted(list(all_languages))
 
+def report_timings(timings, scan_seconds, parse_seconds):
+    total_bytes = sum(size for _, _, size in timings)
+    busy = sum(seconds for seconds, _, _ in timings)
+    print(f"⏱️ Scanned folders in {scan_seconds * 1000:.0f} ms")
+    print(
+        f"⏱️ Parsed {len(timings)} files ({total_bytes / 1e6:.1f} MB) in {parse_seconds:.2f} s "
+        f"({busy:.2f} s of parsing across workers)"
+    )
+    for seconds, folder, size in sorted(timings, reverse=True)[:5]:
+        print(f"   {folder:<24} {seconds * 1000:>8.1f} ms   {size / 1e3:>8.0f} kB")
+
 def save_csv(data, languages):
     filename = "forest_master_list.csv"
     
@@ -86,12 +117,19 @@ def save_csv(data, languages):
     print(f"💾 File saved as: {filename}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extracts tree names in every language from a decoded Forest APK.")
+    parser.add_argument("--res", help="path to the 'res' folder (default: ./res)")
+    parser.add_argument("--jobs", type=int, help="parser processes (default: one per CPU)")
+    args = parser.parse_args()
+
     # Assumes you run this script INSIDE the folder containing 'res'
-    res_dir = os.path.join(os.getcwd(), "res")
+    res_dir = args.res or os.path.join(os.getcwd(), "res")
     
     if os.path.exists(res_dir):
-        tree_data, lang_list = extract_all_languages(res_dir)
+        started = time.perf_counter()
+        tree_data, lang_list = extract_all_languages(res_dir, args.jobs)
         save_csv(tree_data, lang_list)
+        print(f"⏱️ Total: {time.perf_counter() - started:.2f} s")
     else:
         print("❌ Error: Could not find 'res' folder.")
         print("Make sure you are running this inside the decoded APK folder!")
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+Local stand-in for the Telegram Bot API, for load testing without touching Telegram.
+
+    python fake_bot_api.py --rate 200 --duration 30 --launch-bot
+    python fake_bot_api.py --rate 50 --error-rate 0.05 --slow-rate 0.1   # then run the bot yourself
+
+getUpdates hands out synthetic room-link messages (built from stickers.csv, see
+bench_matcher.make_corpus) or recorded updates from a JSON-lines file, at --rate updates
+per second. sendSticker calls are recorded with the time since the update they answer was
+created, and can be made to fail with 429s or respond slowly. Point the bot at it with
+BOT_API_BASE_URL=http://127.0.0.1:8081 (any BOT_TOKEN works). Stats are printed at the
+end and are available at /stats while running.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tornado.web
+from tornado.httpserver import HTTPServer
+from bench_matcher import load_rows, make_corpus, percentile
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake Forest Bot", "username": "fake_forest_bot"}
+
+
+class FakeBotApi:
+    def __init__(self, rate, chats, corpus=None, recorded=None, error_rate=0.0, retry_after=1,
+                 slow_rate=0.0, slow_ms=500, seed=0):
+        self.rate = rate
+        self.chats = chats
+        self.corpus = corpus or []
+        self.recorded = recorded or []
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.rng = random.Random(seed)
+
+        self.started = time.monotonic()
+        self.next_update_id = 1
+        self.pending = []  # updates created but not yet confirmed by an offset
+        self.created = {}  # message ID -> (monotonic time created, corpus kind)
+        self.message_ids = itertools.count(1_000_000)
+
+        self.closing = False
+        self.updates_served = 0
+        self.sticker_calls = 0
+        self.injected_429 = 0
+        self.injected_slow = 0
+        self.reply_latencies = []
+        self.expected_hits = 0  # served updates that should get a sticker
+
+    def _make_update(self, n):
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        if self.recorded:
+            update = json.loads(json.dumps(self.recorded[n % len(self.recorded)]))
+            update["update_id"] = update_id
+            message = update.get("message") or update.get("channel_post") or {}
+            message["date"] = int(time.time())
+            message["message_id"] = update_id
+            kind = "recorded"
+        else:
+            kind, text = self.corpus[n % len(self.corpus)]
+            chat_id = -1_000_000_000_000 - (n % self.chats)
+            update = {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "supergroup", "title": f"Forest {n % self.chats}"},
+                    # A new user per message, so cooldowns don't hide matcher throughput
+                    "from": {"id": 10_000 + n, "is_bot": False, "first_name": "Planter"},
+                    "text": text,
+                },
+            }
+        self.created[update_id] = (time.monotonic(), kind)
+        return update
+
+    def _fill(self):
+        due = int((time.monotonic() - self.started) * self.rate)
+        while self.next_update_id - 1 < due:
+            self.pending.append(self._make_update(self.next_update_id - 1))
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        self.pending = [update for update in self.pending if update["update_id"] >= offset]
+
+        deadline = time.monotonic() + timeout
+        while True:
+            self._fill()
+            if self.pending or self.closing or time.monotonic() >= deadline or self.rate <= 0:
+                break
+            await asyncio.sleep(min(0.01, 1 / self.rate))
+
+        batch = self.pending[:limit]
+        for update in batch:
+            # Update IDs start at 1 and are served in order, so anything above the count is new
+            if update["update_id"] > self.updates_served:
+                self.updates_served = update["update_id"]
+                if self.created.get(update["update_id"], (0, ""))[1].startswith("hit"):
+                    self.expected_hits += 1
+        return batch
+
+    async def send_sticker(self, params):
+        self.sticker_calls += 1
+        if self.rng.random() < self.error_rate:
+            self.injected_429 += 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        if self.rng.random() < self.slow_rate:
+            self.injected_slow += 1
+            await asyncio.sleep(self.slow_ms / 1000)
+
+        reply_to = params.get("reply_parameters") or {}
+        if isinstance(reply_to, dict) and reply_to.get("message_id") in self.created:
+            created, _ = self.created.pop(reply_to["message_id"])
+            self.reply_latencies.append(time.monotonic() - created)
+
+        return 200, {"ok": True, "result": {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"},
+            "from": BOT_USER,
+        }}
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        latencies = sorted(self.reply_latencies)
+        return {
+            "elapsed": round(elapsed, 2),
+            "updates_served": self.updates_served,
+            "expected_hits": self.expected_hits,
+            "sticker_calls": self.sticker_calls,
+            "replies_matched": len(latencies),
+            "injected_429": self.injected_429,
+            "injected_slow": self.injected_slow,
+            "replies_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+            "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        }
+
+
+def _params(request):
+    """Bot API parameters, from a JSON body or form fields (whose values may themselves be JSON)."""
+    if request.headers.get("Content-Type", "").startswith("application/json") and request.body:
+        return json.loads(request.body)
+    params = {}
+    for key, values in {**request.query_arguments, **request.body_arguments}.items():
+        value = values[-1].decode("utf-8")
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    async def get(self, token, method):
+        await self.post(token, method)
+
+    async def post(self, token, method):
+        params = _params(self.request)
+        method = method.lower()
+        status, body = 200, {"ok": True, "result": True}
+        if method == "getme":
+            body = {"ok": True, "result": BOT_USER}
+        elif method == "getupdates":
+            body = {"ok": True, "result": await self.api.get_updates(params)}
+        elif method == "sendsticker":
+            status, body = await self.api.send_sticker(params)
+        self.set_status(status)
+        self.write(body)
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    def get(self):
+        self.write(self.api.stats())
+
+
+def start_fake_api(api, port):
+    app = tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", MethodHandler, {"api": api}),
+        (r"/stats", StatsHandler, {"api": api}),
+    ])
+    server = HTTPServer(app)
+    server.listen(port, address="127.0.0.1")
+    return server
+
+
+def load_recorded(path):
+    with open(path, mode="r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+async def run(args):
+    corpus = make_corpus(load_rows(args.stickers), max(args.corpus_size, 1), args.seed)
+    recorded = load_recorded(args.recorded) if args.recorded else None
+    api = FakeBotApi(
+        args.rate, args.chats, corpus, recorded,
+        error_rate=args.error_rate, retry_after=args.retry_after,
+        slow_rate=args.slow_rate, slow_ms=args.slow_ms, seed=args.seed,
+    )
+    server = start_fake_api(api, args.port)
+    print(f"🧪 Fake Bot API on http://127.0.0.1:{args.port} ({args.rate} updates/s)")
+
+    bot = None
+    if args.launch_bot:
+        env = dict(
+            os.environ,
+            BOT_TOKEN="123456:FAKE",
+            BOT_API_BASE_URL=f"http://127.0.0.1:{args.port}",
+            PORT=str(args.bot_port),
+        )
+        if args.unthrottled:
+            env.update(SEND_GLOBAL_RATE="1e9", SEND_CHAT_RATE="1e9", SEND_CHAT_BURST="1e9")
+        bot = subprocess.Popen([sys.executable, "main.py"], env=env)
+
+    try:
+        await asyncio.sleep(args.duration) if args.duration else await asyncio.Event().wait()
+    finally:
+        if bot is not None:
+            bot.terminate()
+            await asyncio.to_thread(bot.wait)  # the bot still talks to us while it shuts down
+        api.closing = True
+        await asyncio.sleep(0.05)  # let pending long polls return
+        server.stop()
+        print(json.dumps(api.stats(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate", type=float, default=50, help="updates per second handed out by getUpdates")
+    parser.add_argument("--chats", type=int, default=200, help="number of distinct group chats")
+    parser.add_argument("--stickers", default="stickers.csv")
+    parser.add_argument("--corpus-size", type=int, default=6000)
+    parser.add_argument("--recorded", help="JSON-lines file of recorded updates to replay instead")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of sendSticker calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of sendSticker calls answered slowly")
+    parser.add_argument("--slow-ms", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run (0 = until interrupted)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--launch-bot", action="store_true", help="start main.py pointed at this server")
+    parser.add_argument("--bot-port", type=int, default=3001, help="keep-alive port for the launched bot")
+    parser.add_argument("--unthrottled", action="store_true", help="lift the bot's outbound rate limits")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
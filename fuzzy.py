@@ -0,0 +1,141 @@
+import time
+from matcher import UNSPACED_SCRIPTS, fold, trigger_scripts
+
+# Stripped from the ends of message words before comparing ("ceder!" -> "ceder")
+_PUNCTUATION = ".,!?;:()[]{}\"'«»“”‘’…¡¿،؟。、！？"
+
+
+class FuzzyIndex:
+    """
+    Typo-tolerant lookup of triggers, SymSpell style: every casefolded trigger is stored
+    under each string made by deleting up to `max_distance` characters from it. Words of a
+    message then only need their own deletes looked up, and only the few triggers sharing
+    one are compared with a real edit distance.
+
+    Short triggers allow fewer edits (one from 5 characters, two from 8), since a typo in
+    "oak" or "rose" is just another word ("lose"). CJK triggers are left out: without spaces there are no
+    words to compare, and most of their names are two or three characters anyway.
+    """
+
+    def __init__(self, triggers, max_distance=1):
+        # `triggers` must already be in priority order (longest first), like TriggerMatcher's
+        self.max_distance = max_distance
+        self.triggers = []
+        self._words = []  # folded form of each trigger
+        self._limits = []  # edits allowed for each trigger
+        # hash of a deleted form -> rank of the trigger it comes from, or a tuple of ranks.
+        # Hashes instead of the strings keep the index small; a collision only costs one
+        # more edit distance check.
+        self._deletes = {}
+        self._word_counts = set()  # how many words the triggers have
+        self._longest = 0
+        self.last_checked = 0
+        self.timed_out = False
+
+        for trigger in triggers:
+            word = " ".join(fold(trigger).split())
+            scripts = trigger_scripts(trigger)
+            limit = allowed_edits(word, max_distance)
+            if not limit or (scripts and set(scripts) <= UNSPACED_SCRIPTS):
+                continue
+            rank = len(self.triggers)
+            self.triggers.append(trigger)
+            self._words.append(word)
+            self._limits.append(limit)
+            self._word_counts.add(word.count(" ") + 1)
+            self._longest = max(self._longest, len(word))
+            for deleted in _deletes(word, limit):
+                key = hash(deleted)
+                ranks = self._deletes.get(key)
+                if ranks is None:
+                    self._deletes[key] = rank
+                elif isinstance(ranks, int):
+                    if ranks != rank:
+                        self._deletes[key] = (ranks, rank)
+                elif ranks[-1] != rank:
+                    self._deletes[key] = ranks + (rank,)
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def search(self, text, deadline=None):
+        """
+        Returns the trigger closest to a word (or run of words) of text, or None: fewest
+        edits first, then priority order. Gives up with the best match so far once
+        time.perf_counter() passes `deadline`, setting `timed_out`.
+        """
+        words = [word.strip(_PUNCTUATION) for word in fold(text).split() if "/" not in word]
+        words = [word for word in words if word]
+        best = None  # (distance, rank)
+        tested = set()
+        checked = 0
+        self.timed_out = False
+
+        for count in sorted(self._word_counts, reverse=True):
+            for start in range(len(words) - count + 1):
+                if deadline is not None and time.perf_counter() > deadline:
+                    self.timed_out = True
+                    break
+                candidate = " ".join(words[start:start + count])
+                if len(candidate) > self._longest + self.max_distance:
+                    continue
+                for deleted in _deletes(candidate, self.max_distance):
+                    ranks = self._deletes.get(hash(deleted), ())
+                    for rank in (ranks,) if isinstance(ranks, int) else ranks:
+                        if rank in tested:
+                            continue
+                        tested.add(rank)
+                        limit = self._limits[rank] if best is None else min(self._limits[rank], best[0])
+                        distance = edit_distance(candidate, self._words[rank], limit)
+                        if distance <= limit and (best is None or (distance, rank) < best):
+                            best = (distance, rank)
+                    if best is not None and best[0] == 0:
+                        break
+                checked += len(tested)
+                tested.clear()  # the same trigger may be closer to another word
+            if self.timed_out:
+                break
+
+        self.last_checked = checked
+        return None if best is None else self.triggers[best[1]]
+
+
+def allowed_edits(word, max_distance):
+    """Edits a trigger of this (folded) text may be off by: none below 5 characters, one from 5, two from 8..."""
+    return min(max_distance, (len(word) - 2) // 3)
+
+
+def _deletes(word, distance):
+    """`word` and every string made by deleting up to `distance` characters from it."""
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {
+            candidate[:i] + candidate[i + 1:]
+            for candidate in frontier
+            for i in range(len(candidate))
+        } - found
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance with adjacent transpositions ("pnie" is one edit from "pine").
+    Stops early and returns limit + 1 once the distance is known to be over `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
@@ -0,0 +1,84 @@
+import asyncio
+import csv
+import io
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shards there, so no other process writes the files
+    fcntl = None
+
+
+class GroupCommitLog:
+    """
+    Appends lines to a file off the event loop. `append()` returns once the line is on disk;
+    lines that come in while a write is in flight are written together, with a single fsync.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = []  # (text, future)
+        self._flusher = None
+        self.commits = 0
+        self.lines = 0
+
+    async def append(self, text):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush())
+        await future
+
+    async def append_row(self, row):
+        """Appends one CSV row, formatted the way csv.writer would write it."""
+        await self.append(_csv_line(row))
+
+    def write_row(self, row):
+        """Appends one CSV row right away in the calling thread, e.g. while holding file_lock()."""
+        self._write(_csv_line(row))
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    await asyncio.to_thread(self._write, "".join(text for text, _ in batch))
+                except OSError as e:
+                    for _, future in batch:
+                        if not future.done():  # the caller may have been cancelled
+                            future.set_exception(e)
+                else:
+                    self.commits += 1
+                    self.lines += len(batch)
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            self._flusher = None
+
+    def _write(self, text):
+        with open(self.path, mode="a", newline="", encoding="utf-8") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def _csv_line(row):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on `path`.lock, shared by every process editing `path`."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", mode="a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag with a callback scheduled every `interval` seconds.
+    A watchdog thread notices when that callback is overdue by more than `threshold`
+    and grabs the loop thread's stack right then, so a stall is recorded together with
+    the handler that was blocking (e.g. a synchronous file write in a command).
+
+    `observe(lag)` is called on every tick and `on_stall(stall)` once per stall, with
+    {"seconds", "handler", "where", "at"}. The last `keep` stalls are kept in `stalls`.
+    """
+
+    def __init__(self, interval=0.05, threshold=0.1, keep=50):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = deque(maxlen=keep)
+        self.observe = None
+        self.on_stall = None
+        self._loop = None
+        self._loop_thread = None
+        self._handle = None
+        self._expected = 0.0
+        self._last_beat = 0.0
+        self._suspect = None  # set by the watchdog thread while the loop is stuck
+        self._stopped = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        """Must be called from inside the loop to watch."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._expected = self._last_beat + self.interval
+        self._handle = self._loop.call_later(self.interval, self._beat)
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _beat(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self._expected)
+        self._last_beat = now
+        self._expected = now + self.interval
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+        if self.observe is not None:
+            self.observe(lag)
+        if lag > self.threshold:
+            stall = self._suspect or {"handler": "unknown", "where": "unknown"}
+            stall = dict(stall, seconds=lag, at=time.time())
+            self.stalls.append(stall)
+            if self.on_stall is not None:
+                self.on_stall(stall)
+        self._suspect = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            overdue = time.monotonic() - self._last_beat - self.interval
+            if overdue > self.threshold and self._suspect is None:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._suspect = describe(frame)
+
+
+def describe(frame):
+    """Names the code a stuck loop thread is running: the handler it was called from, and where it is now."""
+    frames = traceback.extract_stack(frame)
+    # Only look at the callback the loop is running, not at the loop itself
+    for i in range(len(frames) - 1, -1, -1):
+        if frames[i].filename.endswith(os.path.join("asyncio", "events.py")):
+            frames = frames[i + 1:]
+            break
+    ours = [entry for entry in frames if entry.filename.startswith(REPO_DIR)]
+    if not ours:
+        last = frames[-1] if frames else None
+        where = f"{os.path.basename(last.filename)}:{last.lineno}" if last else "unknown"
+        return {"handler": last.name if last else "unknown", "where": where}
+    return {"handler": ours[0].name, "where": f"{os.path.basename(ours[-1].filename)}:{ours[-1].lineno} in {ours[-1].name}"}
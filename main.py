@@ -1,11 +1,11 @@
+import asyncio
 import os
 import re
-import pytz
+import signal
 import time
-import threading
-import csv
+import pytz
+import io
 import sys
-from flask import Flask
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -16,6 +16,21 @@ from telegram.ext import (
     ConversationHandler,
 )
 from datetime import datetime, timezone, timedelta, time as dt_time
+from trigger_index import TriggerIndex, load_deferred, read_appended
+from sticker_store import StickerStore
+from packs import PackRegistry, DEFAULT_PACK
+from web import start_server
+from update_processor import ChatOrderedUpdateProcessor
+from sender import SendScheduler, BROADCAST, INTERACTIVE
+from schedules import ScheduleStore, fan_out, parse_time, run_stats
+import metrics
+from cooldown import CooldownStore
+from group_commit import GroupCommitLog, file_lock
+from loop_monitor import LoopMonitor
+from concurrent.futures import ThreadPoolExecutor
+from exports import ExportCache
+from telegram.error import BadRequest
+from profiler import SamplingProfiler
 
 # --- ⚙️ START OF CONFIGURATION ---
 
@@ -30,8 +45,11 @@ BOT_ADMIN_IDS = {
 
 # 3. COOLDOWN PERIOD
 COOLDOWN = 5
+COOLDOWN_MAX_ENTRIES = 10_000  # hard cap on remembered (chat, user) pairs
 
 # 4. ⏰ SCHEDULED STICKERS CONFIGURATION
+# Schedules live in SCHEDULES_FILE and are edited with /schedule and /timezone.
+# This list only fills it on first start.
 SCHEDULED_MESSAGES = [
     # Example: 4:00 PM (16:00)
     (0, 0, "CAACAgQAAxkBAAEP91dpOAaVJfFYm08cmUv54NwwuHLfFAAC7hoAAk3CGVPqbt18v28DSjYE", -1002606388153), # bed'o clock
@@ -41,34 +59,216 @@ SCHEDULED_MESSAGES = [
     (9, 0, "CAACAgUAAxkBAAEQJqhpVoP-fWrfRrX8WXwibZoaUIbREAAC8BkAAj2MsVZqH_YwW4qjbDgE", -1002606388153), # trust the process
 ]
 
-# Set Timezone to Mumbai (IST)
+# Set Timezone to Mumbai (IST); chats can pick their own with /timezone
 TIMEZONE = pytz.timezone("Asia/Kolkata")
+SCHEDULES_FILE = "schedules.json"
+SCHEDULE_RUNS_FILE = "schedule_runs.jsonl"  # delivery stats, one JSON line per run
+SCHEDULE_BATCH_SIZE = 50  # chats sent to at once; the next batch waits for this one
+SCHEDULE_BATCH_PAUSE = 1.0  # seconds between batches, leaving room for replies
+SCHEDULE_JITTER = 30  # each run starts up to this many seconds late, so runs don't all start on the minute
+
+# 5. 🗄️ OPTIONAL SQLITE DATABASE
+# Set STICKERS_DB (e.g. "stickers.db") to keep stickers in SQLite instead of stickers.csv.
+# An empty database is filled from stickers.csv on first start.
+STICKERS_DB = os.getenv("STICKERS_DB")
+
+# 6. 🎁 STICKER PACKS
+# Extra packs a chat can switch to with /pack. The "default" pack is stickers.csv (or STICKERS_DB).
+STICKER_PACKS = {
+    "classic": "classic.csv",
+    "winter": "winter.csv",
+    "english": "stickers_english.csv",
+}
+CHAT_PACKS_FILE = "chat_packs.json"  # which packs each chat uses
+
+# 7. 🌐 UPDATES & WEB SERVER
+# "polling" (default) or "webhook". Both serve the keep-alive check on PORT.
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling")
+PORT = int(os.getenv("PORT", 3000))
+WEBHOOK_PATH = "/telegram"
+# Public base URL Telegram should post to, e.g. https://my-bot.onrender.com
+# Leave unset to skip registering the webhook and POST recorded updates to it locally.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# 8. ⚡ CONCURRENCY
+# Updates from different chats are handled in parallel, up to this many at once.
+# Updates from the same chat are always handled in order.
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 32))
+
+# 9. 📤 OUTBOUND RATE LIMITS
+# Telegram allows roughly 30 messages/second overall and 20/minute in one group.
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 25))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 20 / 60))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))
+
+# 10. 🧪 BOT API SERVER
+# Point the bot at another Bot API server, e.g. fake_bot_api.py for load tests.
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+
+# 11. 🔁 DUPLICATE ROOM LINKS
+# A room link that already got a sticker is ignored for this many seconds (0 turns it off),
+# e.g. when it is crossposted to several groups or reposted by someone else.
+# Scope "chat" remembers rooms per chat, "global" across every chat the bot is in.
+ROOM_DEDUP_WINDOW = float(os.getenv("ROOM_DEDUP_WINDOW", 600))
+ROOM_DEDUP_SCOPE = os.getenv("ROOM_DEDUP_SCOPE", "chat")
+ROOM_DEDUP_MAX_ENTRIES = 50_000
+
+# 12. 🧩 SHARDS
+# Set by shards.py when the bot runs as several worker processes: this worker only gets
+# (and only schedules stickers for) chats where chat_id % SHARD_COUNT == SHARD_INDEX.
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+TRIGGER_SYNC_INTERVAL = 5  # seconds between picking up triggers other workers added with /addsticker
+
+# 13. 🐢 EVENT LOOP STALLS
+# The loop is checked every 50 ms; a tick late by more than this many seconds is logged
+# as a stall, with the handler that was blocking it.
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", 0.1))
+
+# 14. 📤 EXPORTS
+# /export sends a numbered snapshot of the stickers, gzipped unless asked for "csv".
+# The last EXPORT_KEEP_VERSIONS snapshots are kept for `/export since <version>`.
+EXPORT_COMPRESS = True
+EXPORT_KEEP_VERSIONS = 20
+
+# 15. 🔬 PROFILER
+# /profile [seconds] samples every thread's stack this often while it runs (nothing runs otherwise).
+PROFILE_INTERVAL = 0.005
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+
+# 16. 🔤 FUZZY MATCHING
+# Off by default. When on, a message with a room link but no exact trigger is matched again
+# allowing typos ("ceder", "pumkin"): up to FUZZY_MAX_DISTANCE edits (short names get fewer),
+# giving up after FUZZY_BUDGET seconds.
+FUZZY_MATCH = os.getenv("FUZZY_MATCH", "0") == "1"
+FUZZY_MAX_DISTANCE = int(os.getenv("FUZZY_MAX_DISTANCE", 1))
+FUZZY_BUDGET = float(os.getenv("FUZZY_BUDGET", 0.002))
 
 # --- END OF CONFIGURATION ---
 
 
 # 📂 Load triggers
-all_triggers = []
-try:
-    with open("stickers.csv", mode="r", encoding="utf-8") as file:
-        reader = csv.reader(file)
-        for row in reader:
-            if len(row) == 2:
-                all_triggers.append((row[0].strip(), row[1].strip()))
-except FileNotFoundError:
-    print("❌ Error: stickers.csv not found! Please create it before running.")
-    sys.exit(1)
-
-all_triggers.sort(key=lambda item: len(item[0]), reverse=True)
-
-TRIGGERS = {trigger: sticker_id for trigger, sticker_id in all_triggers}
-TRIGGER_PATTERNS = {
-    trigger: re.compile(rf"(?<!\S){re.escape(trigger)}(?!\S)", re.IGNORECASE)
-    for trigger in TRIGGERS
-}
+STICKERS_FILE = "stickers.csv"
+TRIGGER_CACHE_DIR = ".trigger_cache"  # compiled snapshots, rebuilt when the CSV changes
+
+# Filled by setup(), so importing this module (tools, benchmarks) reads and writes nothing
+sticker_store = None
+trigger_index = None
+finish_load = None  # without a snapshot, compiles the matcher once the bot is up (see finish_trigger_load)
+matcher_refresh = None  # task recompiling the matcher after /addsticker (see refresh_matcher)
+trigger_offset = 0  # with shards: CSV bytes (or database seq) already read, see sync_triggers
+packs = None
+schedules = None
+
+def setup():
+    """Loads the stickers, the packs and the schedules (seeding them on first start)."""
+    global sticker_store, trigger_index, finish_load, packs, schedules, trigger_offset
+
+    if ROOM_DEDUP_SCOPE not in ("chat", "global"):
+        print(f"❌ Error: ROOM_DEDUP_SCOPE must be chat or global, not '{ROOM_DEDUP_SCOPE}'.")
+        sys.exit(1)
+    if SHARD_COUNT > 1 and ROOM_DEDUP_SCOPE == "global":
+        # Each worker only sees its own chats, so a global scope would quietly become per worker
+        print("❌ Error: ROOM_DEDUP_SCOPE=global doesn't work with shards, use chat.")
+        sys.exit(1)
+
+    load_started = time.perf_counter()
+    from_snapshot = False
+    if STICKERS_DB:
+        sticker_store = StickerStore(STICKERS_DB)
+        if not len(sticker_store) and os.path.exists(STICKERS_FILE):
+            imported = sticker_store.import_csv(STICKERS_FILE)
+            print(f"📥 Imported {imported} rows from {STICKERS_FILE} into {STICKERS_DB}")
+        trigger_offset = sticker_store.last_seq()
+        trigger_index = TriggerIndex(sticker_store.rows())
+    else:
+        try:
+            # Taken first: rows appended meanwhile are read again, and adding them again does nothing
+            trigger_offset = os.path.getsize(STICKERS_FILE)
+            trigger_index, finish_load = load_deferred(STICKERS_FILE, TRIGGER_CACHE_DIR)
+            from_snapshot = finish_load is None
+        except FileNotFoundError:
+            print(f"❌ Error: {STICKERS_FILE} not found! Please create it before running.")
+            sys.exit(1)
+    print(
+        f"⏱️ Loaded {len(trigger_index)} triggers in {(time.perf_counter() - load_started) * 1000:.1f} ms "
+        f"({'snapshot' if from_snapshot else (STICKERS_DB or 'read from CSV') + ', compiling after startup'})"
+    )
 
-# ⏳ Cooldown system dictionary
-last_trigger_time = {}
+    # Other packs are only loaded once a chat switches to them
+    packs = PackRegistry(TRIGGER_CACHE_DIR, CHAT_PACKS_FILE)
+    packs.add_index(DEFAULT_PACK, trigger_index)
+    for pack_name, pack_file in STICKER_PACKS.items():
+        packs.add_pack(pack_name, pack_file)
+
+    # ⏰ Scheduled stickers
+    schedules = ScheduleStore(SCHEDULES_FILE, TIMEZONE.zone, SCHEDULE_RUNS_FILE)
+    if schedules.seed(SCHEDULED_MESSAGES):
+        print(f"📥 Moved {len(SCHEDULED_MESSAGES)} scheduled stickers into {SCHEDULES_FILE}")
+
+# 💾 Disk writes stay off the event loop: CSV appends are group committed, and the
+# SQLite connection is only used from its own thread once the bot is running
+stickers_log = GroupCommitLog(STICKERS_FILE)
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+async def run_db(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, function, *args)
+
+exports = ExportCache(os.path.join(TRIGGER_CACHE_DIR, "exports"), EXPORT_KEEP_VERSIONS)
+
+# 📤 All stickers go out through one rate-limited queue; replies jump ahead of scheduled ones
+sender = SendScheduler(global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST)
+
+# ⏳ Cooldown system: entries expire after COOLDOWN seconds
+cooldowns = CooldownStore(COOLDOWN, max_entries=COOLDOWN_MAX_ENTRIES)
+
+# 🔁 Rooms that already got a sticker, keyed by (chat ID or None, room token)
+ROOM_LINK = re.compile(r"forestapp\.cc/join-room\?token=([\w-]+)")
+rooms_seen = CooldownStore(ROOM_DEDUP_WINDOW, max_entries=ROOM_DEDUP_MAX_ENTRIES)
+
+# 📊 Metrics, served at /metrics
+MESSAGES_SEEN = metrics.counter("forest_messages_total", "Messages checked for triggers")
+MESSAGES_WITH_LINK = metrics.counter("forest_messages_with_link_total", "Messages containing a room link")
+MESSAGES_TOO_OLD = metrics.counter("forest_messages_too_old_total", "Messages skipped by the age check")
+COOLDOWN_SUPPRESSED = metrics.counter("forest_cooldown_suppressed_total", "Messages ignored because the sender is cooling down")
+ROOM_DUPLICATES = metrics.counter("forest_room_duplicates_total", "Messages ignored because their room already got a sticker")
+MATCH_SECONDS = metrics.histogram("forest_match_seconds", "Time spent matching one message", metrics.MATCH_BUCKETS)
+PATTERNS_CHECKED = metrics.histogram("forest_patterns_checked", "Candidate triggers tested per message", metrics.COUNT_BUCKETS)
+FUZZY_SEARCHES = metrics.counter("forest_fuzzy_searches_total", "Typo tolerant searches after an exact miss", ("outcome",))
+FUZZY_SECONDS = metrics.histogram("forest_fuzzy_seconds", "Time spent on one typo tolerant search", metrics.MATCH_BUCKETS)
+REPLY_SECONDS = metrics.histogram("forest_reply_seconds", "Match to sticker reply sent, including queueing", metrics.LATENCY_BUCKETS)
+SEND_WAIT_SECONDS = metrics.histogram("forest_send_wait_seconds", "Time sends spent queued", metrics.LATENCY_BUCKETS)
+SEND_SECONDS = metrics.histogram("forest_send_seconds", "Bot API call duration", metrics.LATENCY_BUCKETS)
+SENDS = metrics.counter("forest_sends_total", "Finished sends by kind and outcome", ("kind", "outcome"))
+SCHEDULED_JOBS = metrics.counter("forest_scheduled_jobs_total", "Scheduled sticker sends by outcome", ("outcome",))
+metrics.gauge("forest_send_queue_depth", "Sends waiting in the queue", lambda: len(sender))
+metrics.gauge("forest_cooldown_entries", "Entries in the cooldown store", lambda: len(cooldowns))
+metrics.counter_func("forest_cooldown_evicted_total", "Cooldown entries evicted by the size cap", lambda: cooldowns.evicted)
+metrics.gauge("forest_rooms_seen_entries", "Rooms remembered for duplicate suppression", lambda: len(rooms_seen))
+LOOP_LAG_SECONDS = metrics.histogram("forest_loop_lag_seconds", "How late event loop ticks ran", metrics.MATCH_BUCKETS[4:] + metrics.LATENCY_BUCKETS)
+LOOP_STALLS = metrics.counter("forest_loop_stalls_total", "Event loop stalls over the threshold, by blocking handler", ("handler",))
+
+def observe_send(priority, outcome, wait, duration):
+    SENDS.inc("reply" if priority == INTERACTIVE else "scheduled", outcome)
+    if outcome != "dropped":
+        SEND_WAIT_SECONDS.observe(wait)
+        SEND_SECONDS.observe(duration)
+
+sender.observe = observe_send
+
+# 🐢 Event loop lag, started with the bot
+loop_monitor = LoopMonitor(threshold=LOOP_STALL_THRESHOLD)
+loop_monitor.observe = LOOP_LAG_SECONDS.observe
+
+def log_stall(stall):
+    LOOP_STALLS.inc(stall["handler"])
+    print(f"🐢 Event loop stalled {stall['seconds'] * 1000:.0f} ms in {stall['handler']} ({stall['where']})")
+
+loop_monitor.on_stall = log_stall
+
+profiler = SamplingProfiler(PROFILE_INTERVAL)
 
 # --- Sticker Response Logic ---
 
@@ -79,9 +279,12 @@ async def check_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not message:
         return
 
+    MESSAGES_SEEN.inc()
+
     # Ignore messages older than 3 minutes
     message_age = datetime.now(timezone.utc) - message.date
     if message_age > timedelta(seconds=15):
+        MESSAGES_TOO_OLD.inc()
         return
  
     chat = update.effective_chat
@@ -91,20 +294,63 @@ async def check_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Helper to test and reply for a given message
     async def process_message(msg):
         key = (chat.id, msg.from_user.id if msg.from_user else 0)
-        now = time.time()
-        if now - last_trigger_time.get(key, 0) < COOLDOWN:
+        now = cooldowns.clock()
+        if cooldowns.is_cooling(key, now):
+            COOLDOWN_SUPPRESSED.inc()
             return
 
         text = msg.text
         # ✅ NEW CONDITION: trigger must match AND link must be present
         if "forestapp.cc/join-room?token=" not in text:
             return
-
-        for trigger, pattern in TRIGGER_PATTERNS.items():
-            if pattern.search(text):
-                await msg.reply_sticker(sticker=TRIGGERS[trigger], disable_notification=True)
-                last_trigger_time[key] = now
-                break
+        MESSAGES_WITH_LINK.inc()
+
+        # Same room posted again (here, or anywhere with the global scope): no second sticker
+        room = None
+        if ROOM_DEDUP_WINDOW > 0:
+            token = ROOM_LINK.search(text)
+            if token:
+                room = (chat.id if ROOM_DEDUP_SCOPE == "chat" else None, token.group(1))
+                if rooms_seen.is_cooling(room, now):
+                    ROOM_DUPLICATES.inc()
+                    return
+
+        # A pack the chat switched to is read from disk the first time, off the loop
+        for name in packs.chain_for(chat.id):
+            if name not in packs.loaded():
+                await asyncio.to_thread(packs.index, name)
+
+        started = time.perf_counter()
+        sticker_id = packs.search(chat.id, text)
+        matched = time.perf_counter()
+        MATCH_SECONDS.observe(matched - started)
+        PATTERNS_CHECKED.observe(packs.last_checked)
+
+        if sticker_id is None and FUZZY_MATCH:
+            # The typo index is built the first time (and after /addsticker) off the loop,
+            # from a copy so /addsticker can't change the table under it
+            for name in packs.chain_for(chat.id):
+                index = packs.index(name)
+                if not index.has_fuzzy_index(FUZZY_MAX_DISTANCE):
+                    built = index.copy()
+                    await asyncio.to_thread(built.fuzzy_index, FUZZY_MAX_DISTANCE)
+                    index.adopt_matcher(built)
+            started = time.perf_counter()
+            sticker_id = packs.fuzzy_search(chat.id, text, FUZZY_MAX_DISTANCE, FUZZY_BUDGET)
+            matched = time.perf_counter()
+            FUZZY_SECONDS.observe(matched - started)
+            FUZZY_SEARCHES.inc("hit" if sticker_id is not None else "timeout" if packs.timed_out else "miss")
+
+        if sticker_id is not None:
+            if room is not None:
+                # Before waiting on the send, so a copy in another chat can't slip in meanwhile
+                rooms_seen.touch(room, now)
+            await sender.submit(
+                lambda: msg.reply_sticker(sticker=sticker_id, disable_notification=True),
+                chat.id,
+            )
+            REPLY_SECONDS.observe(time.perf_counter() - matched)
+            cooldowns.touch(key, now)
 
     # Handle group/private messages
     if update.message and update.message.text:
@@ -119,17 +365,114 @@ async def check_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- ⏰ Scheduled Job Callback (MOVED OUTSIDE) ---
 
-async def send_scheduled_sticker(context: ContextTypes.DEFAULT_TYPE):
-    """Sends the sticker at the scheduled time."""
-    job_data = context.job.data
-    sticker_id = job_data.get("sticker_id")
-    chat_id = job_data.get("chat_id")
+def owns_chat(chat_id):
+    return chat_id % SHARD_COUNT == SHARD_INDEX
 
-    try:
-        await context.bot.send_sticker(chat_id=chat_id, sticker=sticker_id)
-        print(f"✅ Sent scheduled sticker to {chat_id}")
-    except Exception as e:
-        print(f"❌ Failed to send scheduled sticker: {e}")
+async def send_scheduled_sticker(context: ContextTypes.DEFAULT_TYPE):
+    """Sends a schedule's sticker to its chats in one time zone, in paced batches."""
+    name = context.job.data["schedule"]
+    zone = context.job.data["timezone"]
+    schedule = schedules.schedules.get(name)
+    if schedule is None:
+        return
+    sticker_id = schedule["sticker_id"]
+    chat_ids = schedules.targets(name, owns_chat).get(zone, [])
+
+    async def send(chat_id):
+        try:
+            result = await sender.submit(
+                lambda: context.bot.send_sticker(chat_id=chat_id, sticker=sticker_id),
+                chat_id,
+                priority=BROADCAST,
+            )
+        except Exception:
+            SCHEDULED_JOBS.inc("failed")
+            raise
+        SCHEDULED_JOBS.inc("sent")
+        return result
+
+    started = time.monotonic()
+    sent, failed = await fan_out(send, chat_ids, SCHEDULE_BATCH_SIZE, SCHEDULE_BATCH_PAUSE, SCHEDULE_JITTER)
+    await asyncio.to_thread(schedules.record_run, run_stats(name, zone, len(chat_ids), sent, failed, started))
+    print(f"✅ Sent scheduled sticker '{name}' to {sent}/{len(chat_ids)} chats ({zone})")
+
+def register_schedules(job_queue):
+    """(Re)creates one daily job per schedule and time zone, after any change to the schedules."""
+    for job in job_queue.jobs():
+        if job.name and job.name.startswith("schedule:"):
+            job.schedule_removal()
+    for name, schedule in schedules.schedules.items():
+        h, m = parse_time(schedule["time"])
+        for zone in schedules.targets(name, owns_chat):
+            job_queue.run_daily(
+                send_scheduled_sticker,
+                dt_time(hour=h, minute=m, tzinfo=pytz.timezone(zone)),
+                data={"schedule": name, "timezone": zone},
+                name=f"schedule:{name}:{zone}",
+            )
+            print(f"📅 Scheduled '{name}' for {h}:{m:02d} {zone}")
+
+async def finish_trigger_load(context: ContextTypes.DEFAULT_TYPE):
+    """Compiles the matcher and writes the snapshot in a thread, after the first getUpdates went out."""
+    global finish_load
+    started = time.perf_counter()
+    built = await asyncio.to_thread(finish_load)
+    trigger_index.adopt_matcher(built)
+    finish_load = None  # it holds on to the CSV text and rows
+    print(f"🧩 Compiled {len(built)} triggers in the background in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+async def refresh_matcher():
+    """
+    Recompiles the matcher in a thread after /addsticker. Searches keep using the old one
+    until the new one is in, and adds made meanwhile are picked up by another round.
+    """
+    while not trigger_index.compiled:
+        started = time.perf_counter()
+        built = trigger_index.copy()
+        await asyncio.to_thread(built.compile)
+        trigger_index.adopt_matcher(built)
+        print(f"🧩 Recompiled {len(built)} triggers in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+async def compile_triggers_job(context: ContextTypes.DEFAULT_TYPE):
+    """Compiles the matcher for the triggers loaded from the database in a thread, as the bot starts."""
+    schedule_matcher_refresh(context.application)
+
+def schedule_matcher_refresh(application):
+    global matcher_refresh
+    if matcher_refresh is None or matcher_refresh.done():
+        matcher_refresh = application.create_task(refresh_matcher())
+
+async def sync_triggers(application):
+    """With shards: adds the triggers other workers added (to the shared CSV or database) since the last call."""
+    global trigger_offset
+    if sticker_store is not None:
+        rows, trigger_offset = await run_db(sticker_store.rows_after, trigger_offset)
+    else:
+        rows, trigger_offset = await asyncio.to_thread(read_appended, STICKERS_FILE, trigger_offset)
+    added = sum(trigger_index.add(trigger, sticker_id) for trigger, sticker_id in rows)
+    if added:
+        print(f"🔄 Picked up {added} triggers added by other workers")
+        schedule_matcher_refresh(application)
+
+async def sync_triggers_job(context: ContextTypes.DEFAULT_TYPE):
+    await sync_triggers(context.application)
+
+def append_trigger_locked(trigger, sticker_id):
+    """
+    With shards, in a thread: appends a trigger to the CSV unless another worker appended it
+    since our last sync. Checked and written under the file's lock, so only one of them can.
+    """
+    with file_lock(STICKERS_FILE):
+        rows, _ = read_appended(STICKERS_FILE, trigger_offset)
+        if any(row[0] == trigger for row in rows):
+            return False
+        stickers_log.write_row([trigger, sticker_id])
+    return True
+
+async def reload_schedules(context: ContextTypes.DEFAULT_TYPE):
+    """Picks up edits made by hand or by another shard."""
+    if await asyncio.to_thread(schedules.reload):
+        register_schedules(context.job_queue)
 
 
 # --- ✍️ Conversation Logic for /addsticker and /export commands ---
@@ -162,25 +505,39 @@ async def get_trigger(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     trigger_text = update.message.text.strip().lower()
     sticker_id = context.user_data.get('new_sticker_id')
 
-    current_triggers = {}
-    with open("stickers.csv", mode='r', encoding='utf-8') as file:
-        reader = csv.reader(file)
-        for row in reader:
-            if len(row) == 2:
-                current_triggers[row[0].strip()] = row[1].strip()
-
-    if trigger_text in current_triggers:
+    # Reserved before the write is awaited, so two admins can't both add it
+    if not trigger_index.add(trigger_text, sticker_id):
         await update.message.reply_text(
             f"⚠️ The trigger '{trigger_text}' already exists! Please try a different name."
         )
         return GET_TRIGGER
 
-    with open("stickers.csv", mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([trigger_text, sticker_id])
-        file.flush()
-        os.fsync(file.fileno())
+    try:
+        if sticker_store is not None:
+            # The UNIQUE constraint settles a race with another worker adding the same trigger
+            added = await run_db(sticker_store.add_trigger, trigger_text, sticker_id)
+        elif SHARD_COUNT > 1:
+            added = await asyncio.to_thread(append_trigger_locked, trigger_text, sticker_id)
+        else:
+            # Durable once this returns; appends from other admins share the fsync
+            await stickers_log.append_row([trigger_text, sticker_id])
+            added = True
+    except Exception:
+        trigger_index.remove(trigger_text)
+        schedule_matcher_refresh(context.application)
+        raise
+    if not added:
+        # Another worker just added it
+        trigger_index.remove(trigger_text)
+        await sync_triggers(context.application)
+        schedule_matcher_refresh(context.application)
+        await update.message.reply_text(
+            f"⚠️ The trigger '{trigger_text}' already exists! Please try a different name."
+        )
+        return GET_TRIGGER
 
+    # Matched once the matcher is recompiled in the background, a moment later
+    schedule_matcher_refresh(context.application)
     await update.message.reply_text(
         f"✅ Success! Trigger '{trigger_text}' has been saved to this session.\n\n"
         "Send the next sticker, or type /done to finish."
@@ -192,49 +549,303 @@ async def done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data.clear()
     return ConversationHandler.END
 
+def export_store_csv():
+    buffer = io.StringIO()
+    sticker_store.export_csv(buffer)
+    return buffer.getvalue().encode("utf-8")
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+def export_snapshot():
+    """The current version of the stickers, storing a new one if they changed since the last export."""
+    if sticker_store is not None:
+        # Same CSV format as the file-based setup, so the merge workflow doesn't change
+        return exports.snapshot(export_store_csv)
+    stat = os.stat(STICKERS_FILE)
+    return exports.snapshot(lambda: read_file(STICKERS_FILE), (stat.st_size, stat.st_mtime_ns))
+
+async def send_export(message, entry, filename, make_document, caption):
+    """Re-sends the file Telegram already has for this export, or uploads it once and remembers its file_id."""
+    file_id = entry["file_ids"].get(filename)
+    if file_id:
+        try:
+            await message.reply_document(document=file_id, caption=caption)
+            return
+        except BadRequest:
+            pass  # expired or from another bot token, upload it again
+    data = await asyncio.to_thread(make_document)
+    sent = await message.reply_document(document=data, filename=filename, caption=caption)
+    await asyncio.to_thread(exports.remember, entry, filename, sent.document.file_id)
+
 async def export_stickers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export [csv|gz] sends the stickers, /export since <version> [csv|gz] only what changed since then."""
     if update.message.from_user.id not in BOT_ADMIN_IDS:
         await update.message.reply_text("⛔ Sorry, this is an admin-only command.")
         return
 
+    args = [arg.lower() for arg in context.args]
+    compress = EXPORT_COMPRESS
+    if args and args[-1] in ("csv", "gz"):
+        compress = args.pop() == "gz"
+    since = None
+    if args:
+        if len(args) != 2 or args[0] != "since" or not args[1].isdigit():
+            await update.message.reply_text("Usage: /export [csv|gz] or /export since <version> [csv|gz]")
+            return
+        since = int(args[1])
+
     try:
-        await update.message.reply_document(
-            document=open("stickers.csv", "rb"),
-            filename="stickers.csv"
-        )
+        if sticker_store is not None:
+            entry = await run_db(export_snapshot)
+        else:
+            entry = await asyncio.to_thread(export_snapshot)
     except FileNotFoundError:
-        await update.message.reply_text("Could not find stickers.csv to send.")
+        await update.message.reply_text(f"Could not find {STICKERS_FILE} to send.")
+        return
 
-# --- 🌐 Keep-Alive Web Server & Bot Startup ---
+    if since is None:
+        caption = f"Version {entry['version']}, {entry['rows']} rows"
+        filename = exports.filename(entry, compress=compress)
+        await send_export(update.message, entry, filename, lambda: exports.document(entry, compress), caption)
+        return
 
-app_web = Flask(__name__)
+    if since >= entry["version"]:
+        await update.message.reply_text(f"Nothing changed since version {since}, the latest is {entry['version']}.")
+        return
+    try:
+        data, counts = await asyncio.to_thread(exports.delta, since, entry, compress)
+    except KeyError:
+        oldest = exports.versions[0]["version"]
+        await update.message.reply_text(f"⚠️ Version {since} is no longer kept, the oldest is {oldest}.")
+        return
+    caption = (
+        f"Version {since} → {entry['version']}: {counts['add']} added, "
+        f"{counts['change']} changed, {counts['remove']} removed"
+    )
+    filename = exports.filename(entry, since, compress)
+    await send_export(update.message, entry, filename, lambda: data, caption)
 
-@app_web.route("/")
-def home():
-    return "Bot is alive!"
+async def choose_pack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/pack shows this chat's packs, /pack winter default sets them (tried in that order)."""
+    if update.message.from_user.id not in BOT_ADMIN_IDS:
+        await update.message.reply_text("⛔ Sorry, this is an admin-only command.")
+        return
 
-def run_web():
-    app_web.run(host="0.0.0.0", port=3000)
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text(
+            f"🎁 This chat uses: {' → '.join(packs.chain_for(chat_id))}\n"
+            f"Available packs: {', '.join(packs.names())}"
+        )
+        return
 
-def main():
-    threading.Thread(target=run_web, daemon=True).start()
+    names = [name.lower() for name in context.args]
+    try:
+        await asyncio.to_thread(packs.set_chain, chat_id, names)
+    except KeyError as e:
+        await update.message.reply_text(
+            f"⚠️ Unknown pack {e}. Available packs: {', '.join(packs.names())}"
+        )
+        return
+    await update.message.reply_text(f"✅ This chat now uses: {' → '.join(names)}")
+
+SCHEDULE_USAGE = (
+    "/schedule - list schedules\n"
+    "/schedule add <name> <HH:MM> [sticker ID] - add or change one (or reply to a sticker)\n"
+    "/schedule remove <name>\n"
+    "/schedule join <name> [chat ID] - send it to this chat (or another one)\n"
+    "/schedule leave <name> [chat ID]"
+)
+
+async def manage_schedules(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/schedule lists, adds, removes and targets scheduled stickers; changes apply right away."""
+    if update.message.from_user.id not in BOT_ADMIN_IDS:
+        await update.message.reply_text("⛔ Sorry, this is an admin-only command.")
+        return
+
+    args = context.args
+    if not args:
+        lines = []
+        for name, schedule in sorted(schedules.schedules.items()):
+            line = f"⏰ {name} - {schedule['time']}, {len(schedule['chats'])} chats"
+            last = schedules.last_runs.get(name)
+            if last:
+                line += f" (last run: {last['sent']}/{last['chats']} sent)"
+            lines.append(line)
+        await update.message.reply_text("\n".join(lines) or "No schedules yet.\n\n" + SCHEDULE_USAGE)
+        return
+
+    action, rest = args[0].lower(), args[1:]
+    try:
+        if action == "add" and len(rest) >= 2:
+            reply = update.message.reply_to_message
+            if len(rest) >= 3:
+                sticker_id = rest[2]
+            elif reply and reply.sticker:
+                sticker_id = reply.sticker.file_id
+            else:
+                await update.message.reply_text("⚠️ Give a sticker ID or reply to a sticker.")
+                return
+            await asyncio.to_thread(schedules.add, rest[0], rest[1], sticker_id)
+            text = f"✅ '{rest[0]}' is set for {rest[1]}."
+        elif action == "remove" and len(rest) == 1:
+            await asyncio.to_thread(schedules.remove, rest[0])
+            text = f"✅ Removed '{rest[0]}'."
+        elif action in ("join", "leave") and len(rest) in (1, 2):
+            chat_id = int(rest[1]) if len(rest) == 2 else update.effective_chat.id
+            if action == "join":
+                await asyncio.to_thread(schedules.add_chat, rest[0], chat_id)
+                text = f"✅ Chat {chat_id} now gets '{rest[0]}' at {schedules.schedules[rest[0]]['time']} {schedules.timezone_for(chat_id)}."
+            else:
+                await asyncio.to_thread(schedules.remove_chat, rest[0], chat_id)
+                text = f"✅ Chat {chat_id} no longer gets '{rest[0]}'."
+        else:
+            await update.message.reply_text(SCHEDULE_USAGE)
+            return
+    except KeyError as e:
+        register_schedules(context.job_queue)  # the store re-read the file, other shards' edits may be in it
+        await update.message.reply_text(f"⚠️ Unknown schedule {e}.")
+        return
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    register_schedules(context.job_queue)
+    await update.message.reply_text(text)
+
+async def chat_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/timezone shows this chat's time zone, /timezone Europe/Berlin sets it for its scheduled stickers."""
+    if update.message.from_user.id not in BOT_ADMIN_IDS:
+        await update.message.reply_text("⛔ Sorry, this is an admin-only command.")
+        return
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text(f"🕰️ This chat uses {schedules.timezone_for(chat_id)}.")
+        return
+    try:
+        await asyncio.to_thread(schedules.set_timezone, chat_id, context.args[0])
+    except pytz.UnknownTimeZoneError:
+        await update.message.reply_text(f"⚠️ Unknown time zone '{context.args[0]}', e.g. Europe/Berlin.")
+        return
+    register_schedules(context.job_queue)
+    await update.message.reply_text(f"✅ This chat now uses {context.args[0]}.")
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile [seconds] profiles the running bot and sends the hotspots, /profile stop ends it early."""
+    if update.message.from_user.id not in BOT_ADMIN_IDS:
+        await update.message.reply_text("⛔ Sorry, this is an admin-only command.")
+        return
+
+    if context.args and context.args[0].lower() == "stop":
+        jobs = context.job_queue.get_jobs_by_name("profile")
+        if not jobs:
+            await update.message.reply_text("The profiler isn't running.")
+            return
+        for job in jobs:
+            job.schedule_removal()
+        await send_profile(context.bot, jobs[0].chat_id)
+        return
+
+    if profiler.running:
+        await update.message.reply_text("🔬 The profiler is already running, /profile stop ends it.")
+        return
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds] or /profile stop")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    profiler.start()
+    # Finishes from a job, so this chat's updates aren't held up meanwhile
+    context.job_queue.run_once(finish_profile, seconds, chat_id=update.effective_chat.id, name="profile")
+    await update.message.reply_text(f"🔬 Profiling for {seconds} s...")
+
+async def finish_profile(context: ContextTypes.DEFAULT_TYPE):
+    await send_profile(context.bot, context.job.chat_id)
+
+async def send_profile(bot, chat_id):
+    if not profiler.running:
+        return  # /profile stop and the job both got here
+    result = await asyncio.to_thread(profiler.stop)
+    print(f"🔬 Profiled {result.seconds:.0f} s for chat {chat_id}")
+    await bot.send_message(chat_id, result.report())
+    await bot.send_document(
+        chat_id,
+        document=result.collapsed().encode("utf-8"),
+        filename=f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded",
+        caption="Collapsed stacks, open with speedscope.app or flamegraph.pl",
+    )
+
+# --- 🌐 Keep-Alive Web Server & Bot Startup ---
+
+async def on_startup(application: Application) -> None:
+    """post_init hook: starts the send queue and serves the keep-alive check on the bot's own event loop."""
+    await sender.start()
+    loop_monitor.start()
+    start_server(application, PORT)
+
+async def on_shutdown(application: Application) -> None:
+    loop_monitor.stop()
+    await sender.stop()
+
+async def run_webhook(application: Application) -> None:
+    """Receives updates over HTTP on the same loop as the Application."""
+    async with application:
+        server = start_server(application, PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        elif SHARD_COUNT == 1:
+            print(f"🧪 WEBHOOK_URL not set, POST updates to http://localhost:{PORT}{WEBHOOK_PATH}")
+        await application.start()
+        await sender.start()
+        loop_monitor.start()
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+
+        loop_monitor.stop()
+        await sender.stop()
+        await application.stop()
+        server.stop()
+
+def main():
+    setup()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    )
+    if BOT_API_BASE_URL:
+        base_url = BOT_API_BASE_URL.rstrip("/")
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    if UPDATE_MODE == "webhook":
+        builder = builder.updater(None)
+    else:
+        builder = builder.post_init(on_startup).post_shutdown(on_shutdown)
+    application = builder.build()
 
     # --- ⏰ INITIALIZE SCHEDULER ---
     job_queue = application.job_queue
 
-    for h, m, sticker, chat_id in SCHEDULED_MESSAGES:
-        # Create a time object with timezone info
-        target_time = dt_time(hour=h, minute=m, tzinfo=TIMEZONE)
-        
-        job_queue.run_daily(
-            send_scheduled_sticker,
-            target_time,
-            data={"sticker_id": sticker, "chat_id": chat_id},
-            name=f"sticker_{h}_{m}"
-        )
-        print(f"📅 Scheduled sticker for {h}:{m:02d} in chat {chat_id}")
+    register_schedules(job_queue)
+    job_queue.run_repeating(reload_schedules, interval=60, first=60, name="reload_schedules")
+    if finish_load is not None:
+        job_queue.run_once(finish_trigger_load, 1, name="finish_trigger_load")
+    elif not trigger_index.compiled:
+        job_queue.run_once(compile_triggers_job, 0, name="compile_triggers")
+    if SHARD_COUNT > 1:
+        job_queue.run_repeating(sync_triggers_job, interval=TRIGGER_SYNC_INTERVAL, first=TRIGGER_SYNC_INTERVAL, name="sync_triggers")
     # -------------------------------
 
     conv_handler = ConversationHandler(
@@ -248,10 +859,18 @@ def main():
 
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler('export', export_stickers))
+    application.add_handler(CommandHandler('pack', choose_pack))
+    application.add_handler(CommandHandler('schedule', manage_schedules))
+    application.add_handler(CommandHandler('timezone', chat_timezone))
+    application.add_handler(CommandHandler('profile', profile))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, check_text))
 
-    print("🤖 Bot is running...")
-    application.run_polling()
+    shard = f", shard {SHARD_INDEX + 1}/{SHARD_COUNT}" if SHARD_COUNT > 1 else ""
+    print(f"🤖 Bot is running ({UPDATE_MODE}{shard})...")
+    if UPDATE_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
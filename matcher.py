@@ -0,0 +1,334 @@
+import re
+from array import array
+from bisect import bisect_right
+
+# Characters that re.IGNORECASE treats as equal even though .lower() differs
+# (Turkish dotless i, long s, Greek final sigma, old Cyrillic forms...).
+# Each one maps to a single representative of its group.
+_CASE_FIXES = str.maketrans(
+    "\u0131\u017f\u03b9\u03bc\u03c3\u03d0\u03d1\u03d5\u03d6\u03f0\u03f1\u03f5\u1c80"
+    "\u1c81\u1c82\u1c83\u1c84\u1c85\u1c86\u1c87\u1e9b\u1fbe\u1fd3\u1fe3\ua64b\ufb06",
+    "is\u0345\xb5\u03c2\u03b2\u03b8\u03c6\u03c0\u03ba\u03c1\u03b5\u0432"
+    "\u0434\u043e\u0441\u0442\u0442\u044a\u0463\u1e61\u0345\u0390\u03b0\u1c88\ufb05",
+)
+
+
+_HAS_CASE_FIXES = re.compile("[" + "".join(map(chr, _CASE_FIXES)) + "]")
+
+
+def fold(text):
+    """Casefolds text the way re.IGNORECASE compares it, without changing its length."""
+    folded = text.lower()
+    if len(folded) != len(text):
+        # A few characters (e.g. 'İ') lowercase to two code points; keep those as-is.
+        folded = "".join(ch if len(ch.lower()) != 1 else ch.lower() for ch in text)
+    # translate() is slow on non-ASCII text, so only run it when there is something to fix
+    if not folded.isascii() and _HAS_CASE_FIXES.search(folded):
+        folded = folded.translate(_CASE_FIXES)
+    return folded
+
+
+# Code point ranges of the scripts used by Forest's tree names, sorted by start.
+# Anything else is "other" if it's a letter, or None (digits, punctuation, spaces, emoji...).
+_SCRIPT_RANGES = [
+    (0x00C0, 0x024F, "latin"),
+    (0x0370, 0x03FF, "greek"),
+    (0x0400, 0x052F, "cyrillic"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0750, 0x077F, "arabic"),
+    (0x0E00, 0x0E7F, "thai"),
+    (0x1100, 0x11FF, "hangul"),
+    (0x1E00, 0x1EFF, "latin"),
+    (0x3040, 0x30FF, "cjk"),  # hiragana, katakana
+    (0x3130, 0x318F, "hangul"),
+    (0x31F0, 0x31FF, "cjk"),
+    (0x3400, 0x4DBF, "cjk"),
+    (0x4E00, 0x9FFF, "cjk"),
+    (0xAC00, 0xD7AF, "hangul"),
+    (0xF900, 0xFAFF, "cjk"),
+    (0xFB50, 0xFDFF, "arabic"),
+    (0xFE70, 0xFEFF, "arabic"),
+    (0xFF66, 0xFF9F, "cjk"),  # halfwidth katakana
+]
+_SCRIPT_STARTS = [start for start, _, _ in _SCRIPT_RANGES]
+
+# Scripts written without spaces between words: their triggers may sit inside running text
+UNSPACED_SCRIPTS = {"cjk"}
+# Shorter ones still need whitespace around them: a single character like 杉 or 竹 is
+# part of too many other words (杉山, 爆竹)
+MIN_UNBOUNDED_LENGTH = 2
+
+
+def script_of(ch):
+    if ch < "\x80":
+        return "latin" if ch.isalpha() else None
+    code = ord(ch)
+    i = bisect_right(_SCRIPT_STARTS, code) - 1
+    if i >= 0 and code <= _SCRIPT_RANGES[i][1]:
+        return _SCRIPT_RANGES[i][2]
+    return "other" if ch.isalpha() else None
+
+
+def _script_pattern(script):
+    """Regex matching any character of a script (only used for scripts with code point ranges)."""
+    ranges = "".join(f"{chr(start)}-{chr(end)}" for start, end, name in _SCRIPT_RANGES if name == script)
+    if script == "latin":
+        ranges += "a-zA-Z"
+    return re.compile(f"[{ranges}]")
+
+
+_NO_EDGES = {}  # shared by every state without a dict of its own, never written to
+
+
+class TriggerMatcher:
+    """
+    Aho-Corasick automaton over casefolded triggers.
+    Finds the same trigger as testing `(?<!\\S)trigger(?!\\S)` with re.IGNORECASE
+    for every trigger in priority order, but in a single pass over the message.
+    With bounded=False triggers may also match inside a word (for CJK).
+    """
+
+    def __init__(self, triggers, bounded=True):
+        # `triggers` must already be in priority order (longest first).
+        self.triggers = list(triggers)
+        self.bounded = bounded
+
+        goto = [{}]
+        fail = [0]
+        own = [None]
+
+        for rank, trigger in enumerate(self.triggers):
+            word = fold(trigger)
+            if not word:
+                continue
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    fail.append(0)
+                    own.append(None)
+                state = nxt
+            # Identical folded triggers: only the highest priority one can ever win.
+            if own[state] is None:
+                own[state] = (rank, len(word))
+
+        # Breadth-first pass to wire up failure links and merged outputs.
+        out = [()] * len(goto)
+        queue = []
+        for child in goto[0].values():
+            queue.append(child)
+        for state in queue:
+            if own[state] is not None:
+                out[state] = (own[state],)
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, child in goto[state].items():
+                link = fail[state]
+                while link and ch not in goto[link]:
+                    link = fail[link]
+                fail[child] = goto[link].get(ch, 0)
+                merged = out[fail[child]]
+                if own[child] is not None:
+                    merged = (own[child],) + merged
+                out[child] = tuple(sorted(merged))
+                queue.append(child)
+
+        self._set_transitions(goto)
+        self._fail = array("i", fail)
+        self._out = out
+        self._set_alphabet("".join(sorted({ch for edges in goto for ch in edges})))
+        self.last_checked = 0
+
+    def _set_transitions(self, goto):
+        # Most states (the inner characters of the triggers) have a single edge, so a dict
+        # per state mostly held one entry. Those now sit in two flat lists, and only states
+        # with several edges keep a dict.
+        chars = {}  # one shared string per character
+        self._only = only = []
+        self._next = targets = array("i")
+        self._branches = branches = []
+        for edges in goto:
+            if len(edges) == 1:
+                (ch, target), = edges.items()
+                only.append(chars.setdefault(ch, ch))
+                targets.append(target)
+                branches.append(_NO_EDGES)
+            else:
+                only.append("")
+                targets.append(0)
+                branches.append(edges or _NO_EDGES)
+
+    def _set_alphabet(self, alphabet):
+        # A trigger can only sit inside a run of characters that appear in some trigger,
+        # so only those runs are fed to the automaton (found by a regex, at C speed).
+        # Whitespace only continues a run, it never starts or ends one.
+        self._alphabet = alphabet
+        chars = "".join(ch for ch in alphabet if not ch.isspace())
+        if not chars:
+            self._runs = None
+        elif len(chars) == len(alphabet):
+            self._runs = re.compile(f"[{re.escape(chars)}]+")
+        else:
+            spaces = "".join(ch for ch in alphabet if ch.isspace())
+            self._runs = re.compile(f"[{re.escape(chars)}]+(?:[{re.escape(spaces)}]+[{re.escape(chars)}]+)*")
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def search(self, text):
+        """Returns the highest priority trigger found in text, or None."""
+        return self.search_folded(fold(text))
+
+    def search_folded(self, folded):
+        """Same as search(), for text that already went through fold()."""
+        only, targets, branches, fail, out = self._only, self._next, self._branches, self._fail, self._out
+        bounded = self.bounded
+        last = len(folded) - 1
+        best = None
+        checked = 0  # candidate triggers whose boundaries were tested
+
+        for run in self._runs.finditer(folded) if self._runs is not None else ():
+            state = 0
+            for i in range(run.start(), run.end()):
+                ch = folded[i]
+                while True:
+                    if only[state] == ch:
+                        state = targets[state]
+                        break
+                    target = branches[state].get(ch)
+                    if target is not None:
+                        state = target
+                        break
+                    if not state:
+                        break
+                    state = fail[state]
+
+                for rank, length in out[state]:
+                    if best is not None and rank >= best:
+                        break
+                    checked += 1
+                    start = i - length + 1
+                    if not bounded or (
+                        (start == 0 or folded[start - 1].isspace()) and (i == last or folded[i + 1].isspace())
+                    ):
+                        best = rank
+                        break
+
+                if best == 0:
+                    break
+            if best == 0:
+                break
+
+        self.last_checked = checked
+        return None if best is None else self.triggers[best]
+
+    def to_state(self):
+        """Plain tuples/lists/dicts only, so the automaton can be marshalled to disk."""
+        branching = {state: edges for state, edges in enumerate(self._branches) if edges is not _NO_EDGES}
+        only = "".join(ch or "\0" for ch in self._only)
+        return (
+            self.triggers, self.bounded, self._alphabet, only,
+            self._next.tobytes(), branching, self._fail.tobytes(), self._out,
+        )
+
+    @classmethod
+    def from_state(cls, state):
+        matcher = cls.__new__(cls)
+        matcher.triggers, matcher.bounded, alphabet, only, targets, branching, fail, matcher._out = state
+        matcher._next, matcher._fail = array("i"), array("i")
+        matcher._next.frombytes(targets)
+        matcher._fail.frombytes(fail)
+        chars = {"\0": ""}
+        matcher._only = [chars.setdefault(ch, ch) for ch in only]
+        matcher._branches = [_NO_EDGES] * len(only)
+        for state, edges in branching.items():
+            matcher._branches[state] = edges
+        matcher._set_alphabet(alphabet)
+        matcher.last_checked = 0
+        return matcher
+
+
+class ScriptMatcher:
+    """
+    Triggers split by Unicode script, one TriggerMatcher per bucket.
+    A message is casefolded once, its scripts are collected from its distinct characters,
+    and only the buckets whose scripts all occur in the message run.
+    Triggers written only in an unspaced script (CJK), two characters or longer, get their
+    own bucket, where they don't need surrounding whitespace. Everything else shares one
+    bucket: the automaton
+    costs per character scanned, not per trigger, so splitting spaced scripts further
+    would only scan the same text (room links are Latin) several times.
+    """
+
+    def __init__(self, triggers):
+        # `triggers` must already be in priority order (longest first).
+        self.triggers = list(triggers)
+        buckets = {}
+        for trigger in self.triggers:
+            buckets.setdefault(trigger_scripts(trigger) if is_unbounded(trigger) else (), []).append(trigger)
+        self._matchers = {
+            scripts: TriggerMatcher(bucket, bounded=not scripts)
+            for scripts, bucket in buckets.items()
+        }
+        self._init()
+
+    def _init(self):
+        self._rank = {}
+        for rank, trigger in enumerate(self.triggers):
+            self._rank.setdefault(trigger, rank)
+        # A bucket only runs if the message has a character of each of its scripts
+        self._needs = [
+            ([_script_pattern(script) for script in scripts], matcher) for scripts, matcher in self._matchers.items()
+        ]
+        self.last_checked = 0
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def search(self, text):
+        """Returns the highest priority trigger found in text, or None."""
+        folded = fold(text)
+        best = None
+        best_rank = len(self.triggers)
+        checked = 0
+        plain = folded.isascii()  # then only the shared bucket can match, without scanning for other scripts
+        for needs, matcher in self._needs:
+            if needs and (plain or not all(pattern.search(folded) for pattern in needs)):
+                continue
+            trigger = matcher.search_folded(folded)
+            checked += matcher.last_checked
+            if trigger is not None and self._rank[trigger] < best_rank:
+                best = trigger
+                best_rank = self._rank[trigger]
+        self.last_checked = checked
+        return best
+
+    def to_state(self):
+        return (
+            self.triggers,
+            {scripts: matcher.to_state() for scripts, matcher in self._matchers.items()},
+        )
+
+    @classmethod
+    def from_state(cls, state):
+        matcher = cls.__new__(cls)
+        matcher.triggers, matchers = state
+        matcher._matchers = {scripts: TriggerMatcher.from_state(sub) for scripts, sub in matchers.items()}
+        matcher._init()
+        return matcher
+
+
+def is_unbounded(trigger):
+    """True for triggers that match inside running text: unspaced script only, and long enough."""
+    scripts = trigger_scripts(trigger)
+    return bool(scripts) and set(scripts) <= UNSPACED_SCRIPTS and len(fold(trigger)) >= MIN_UNBOUNDED_LENGTH
+
+
+def trigger_scripts(trigger):
+    """The scripts a trigger is written in, as a sorted tuple (empty if it has no letters)."""
+    return tuple(sorted({script_of(ch) for ch in fold(trigger)} - {None}))
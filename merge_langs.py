@@ -1,5 +1,11 @@
+import argparse
 import csv
+import hashlib
+import json
+import os
 import re
+import time
+from sticker_store import StickerStore
 
 # Config: Columns to IGNORE (Android system folders)
 # We filter these out to keep your final file clean.
@@ -19,13 +25,48 @@ def is_junk_column(col_name):
             return True
     return False
 
+def name_columns(headers):
+    """Indexes of the columns holding tree names: all but ID, Key and the junk columns. Worked out once per file."""
+    return [i for i, col_name in enumerate(headers) if col_name not in ['ID', 'Key'] and not is_junk_column(col_name)]
+
+def tree_digest(row, sticker_id):
+    """Fingerprint of a master list row and its sticker: if it is the same as last time, so are its triggers."""
+    return hashlib.sha256(("\x1f".join(row) + "\x1e" + sticker_id).encode("utf-8")).hexdigest()[:16]
+
+def load_merge_state(path):
+    """Tree key -> {"hash", "names"} as of the last applied incremental merge, {} if there was none."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_merge_state(trees, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(trees, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def is_db_file(path):
+    return path.endswith((".db", ".sqlite", ".sqlite3"))
+
 def load_stickers_map(sticker_file):
     """
-    Loads your current stickers.csv into a map.
+    Loads your current stickers.csv (or SQLite sticker database) into a map.
     Key: English Tree Name (lowercase)
     Value: Sticker ID
     """
     sticker_map = {}
+    if is_db_file(sticker_file):
+        # sqlite3 would create a missing file, and the merge would go on with no stickers
+        if not os.path.exists(sticker_file):
+            print(f"❌ Error: Could not find '{sticker_file}'.")
+            exit()
+        store = StickerStore(sticker_file)
+        for trigger, sticker_id in store.rows():
+            sticker_map[trigger.strip().lower()] = sticker_id
+        store.close()
+        return sticker_map
     try:
         with open(sticker_file, 'r', encoding='utf-8') as f:
             reader = csv.reader(f)
@@ -39,9 +80,19 @@ def load_stickers_map(sticker_file):
         exit()
     return sticker_map
 
-def merge_files(master_file, sticker_map):
+def merge_files(master_file, sticker_map, previous=None):
+    """
+    Returns (rows, trees, skipped): [trigger, sticker_id, tree_id, lang] rows, the merge state
+    of every tree (for save_merge_state) and how many trees were skipped. Trees whose row and
+    sticker match `previous` (a loaded merge state) are not processed again: their triggers
+    are already in the sticker file, so they only reserve their names for conflict checks.
+    """
+    previous = previous or {}
+    trees = {}
+    skipped = 0
     final_rows = []
-    seen_triggers = set() # To avoid duplicates like "Cedar" appearing 10 times
+    seen_triggers = {} # To avoid duplicates like "Cedar" appearing 10 times: trigger -> (sticker ID, tree)
+    conflicts = [] # Same name used by two different trees, e.g. white rose and white birch in Arabic
 
     with open(master_file, 'r', encoding='utf-8') as f:
         reader = csv.reader(f)
@@ -54,8 +105,10 @@ def merge_files(master_file, sticker_map):
         except ValueError:
             print("❌ Error: Could not find 'default' column in master list.")
             exit()
+        id_idx = headers.index('ID') if 'ID' in headers else None
+        columns = name_columns(headers)
 
-        print(f"🔹 Processing {len(headers)} columns...")
+        print(f"🔹 Processing {len(headers)} columns ({len(columns)} with tree names)...")
 
         for row in reader:
             # Get the English name for this row (e.g., "Cedar")
@@ -65,44 +118,149 @@ def merge_files(master_file, sticker_map):
             # 2. Find the matching Sticker ID
             if english_name in sticker_map:
                 sticker_id = sticker_map[english_name]
-                
-                # 3. Iterate through ALL columns in this row
-                for i, cell_value in enumerate(row):
-                    col_name = headers[i]
-                    
-                    # Skip ID, Key, and Junk columns
-                    if col_name in ['ID', 'Key'] or is_junk_column(col_name):
+                tree_id = int(row[id_idx]) if id_idx is not None and row[id_idx].isdigit() else None
+                key = str(tree_id) if tree_id is not None else english_name
+                digest = tree_digest(row, sticker_id)
+                known = previous.get(key)
+                if known is not None and known["hash"] == digest:
+                    skipped += 1
+                    trees[key] = known
+                    for trigger_word in known["names"]:
+                        seen_triggers.setdefault(trigger_word, (sticker_id, english_name))
+                    continue
+                names = []
+
+                # 3. Iterate through the name columns in this row (ID, Key and junk columns are skipped)
+                for i in columns:
+                    if i >= len(row):
                         continue
-                    
+                    col_name = headers[i]
+
                     # .strip('"') removes the quote marks from the start and end
-                    trigger_word = cell_value.strip().strip('"').lower()
-                    
+                    trigger_word = row[i].strip().strip('"').lower()
+                    if trigger_word and trigger_word not in names:
+                        names.append(trigger_word)
+
                     # Only add if it has text and we haven't seen this exact trigger pair yet
                     if trigger_word and trigger_word not in seen_triggers:
-                        final_rows.append([trigger_word, sticker_id])
-                        seen_triggers.add(trigger_word)
+                        # Tree ID and language column are only kept by the SQLite store
+                        final_rows.append([trigger_word, sticker_id, tree_id, col_name])
+                        seen_triggers[trigger_word] = (sticker_id, english_name)
+                    elif trigger_word and seen_triggers[trigger_word][0] != sticker_id:
+                        conflicts.append((trigger_word, col_name, seen_triggers[trigger_word][1], english_name))
+                trees[key] = {"hash": digest, "names": names}
             else:
                 # Optional: Print trees you have NO sticker for
                 # print(f"⚠️ Skipping '{english_name}' (No sticker found)")
                 pass
 
-    return final_rows
+    for trigger_word, col_name, kept, other in conflicts:
+        print(f"⚠️ '{trigger_word}' ({col_name}) names both '{kept}' and '{other}', kept '{kept}'")
+
+    return final_rows, trees, skipped
+
+def diff_triggers(merged_rows, sticker_map):
+    """
+    Compares a merge against the triggers we already have and returns the changeset:
+    [action, trigger, sticker_id, tree_id, lang] rows, "add" for new triggers and "change"
+    for ones whose sticker changed. Everything else (including hand-added triggers that
+    aren't in the master list) is left alone.
+    """
+    changeset = []
+    for trigger, sticker_id, tree_id, col_name in merged_rows:
+        current = sticker_map.get(trigger)
+        if current is None:
+            changeset.append(["add", trigger, sticker_id, tree_id, col_name])
+        elif current != sticker_id:
+            changeset.append(["change", trigger, sticker_id, tree_id, col_name])
+    return changeset
+
+def save_changeset(changeset, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['action', 'trigger', 'sticker_id', 'tree_id', 'lang'])
+        writer.writerows(changeset)
+
+def apply_changeset(changeset, sticker_file):
+    """
+    Applies a changeset in place: one upsert transaction for the SQLite store, or appended
+    rows for stickers.csv (a repeated trigger takes the newer sticker when the bot loads it).
+    """
+    if is_db_file(sticker_file):
+        store = StickerStore(sticker_file)
+        store.put_rows([row[1:] for row in changeset])
+        store.close()
+        return
+    with open(sticker_file, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerows(row[1:3] for row in changeset)
+        f.flush()
+        os.fsync(f.fileno())
+
+def report_changeset(changeset):
+    trees = {}
+    for action, trigger, _, tree_id, _ in changeset:
+        trees.setdefault(tree_id, []).append(f"{'+' if action == 'add' else '~'}{trigger}")
+    for tree_id, triggers in sorted(trees.items(), key=lambda item: (item[0] is None, item[0] or 0)):
+        shown = ", ".join(triggers[:6]) + (f", ... ({len(triggers)} total)" if len(triggers) > 6 else "")
+        print(f"   🌱 Tree {tree_id}: {shown}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge forest_master_list.csv into the sticker database.")
+    parser.add_argument("--db", help="SQLite sticker database to read from and write the merged triggers into")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only write the new and changed triggers to stickers_changeset.csv")
+    parser.add_argument("--apply", action="store_true",
+                        help="with --incremental, also apply the changeset to stickers.csv (or --db) in place")
+    parser.add_argument("--state", default="merge_state.json",
+                        help="per-tree fingerprints of the last applied incremental merge, unchanged trees are skipped")
+    args = parser.parse_args(argv)
+    if args.apply and not args.incremental:
+        parser.error("--apply only works with --incremental")
 
-if __name__ == "__main__":
     print("🚀 Starting Merge...")
+    started = time.perf_counter()
+    sticker_file = args.db or "stickers.csv"
     
     # Load IDs
-    st_map = load_stickers_map("stickers.csv")
+    st_map = load_stickers_map(sticker_file)
     print(f"✅ Loaded {len(st_map)} sticker IDs.")
     
-    # Merge
-    multilingual_data = merge_files("forest_master_list.csv", st_map)
-    
-    # Save
-    output_file = "stickers_final.csv"
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerows(multilingual_data)
+    # Merge (incrementally: only the trees that changed since the last applied merge)
+    previous = load_merge_state(args.state) if args.incremental else None
+    multilingual_data, trees, skipped = merge_files("forest_master_list.csv", st_map, previous)
+
+    if args.incremental:
+        print(f"⏭️ Skipped {skipped} unchanged trees, merged {len(trees) - skipped}.")
+        changeset = diff_triggers(multilingual_data, st_map)
+        output_file = "stickers_changeset.csv"
+        save_changeset(changeset, output_file)
+        added = sum(1 for row in changeset if row[0] == "add")
+        print(f"🧾 {added} new and {len(changeset) - added} changed triggers (of {len(multilingual_data)} merged) in '{output_file}'.")
+        report_changeset(changeset)
+        if args.apply:
+            if changeset:
+                apply_changeset(changeset, sticker_file)
+                print(f"🗄️ Applied {len(changeset)} triggers to '{sticker_file}'. Restart the bot to pick them up.")
+            # Only once applied: trees left out of an unapplied changeset must be merged again
+            save_merge_state(trees, args.state)
+    else:
+        # Save
+        output_file = "stickers_final.csv"
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerows(row[:2] for row in multilingual_data)
         
-    print(f"🎉 SUCCESS! Created '{output_file}' with {len(multilingual_data)} total triggers.")
-    print("👉 Rename this file to 'stickers.csv' and upload it to GitHub!") 
\ No newline at end of file
+        print(f"🎉 SUCCESS! Created '{output_file}' with {len(multilingual_data)} total triggers.")
+
+        if args.db:
+            store = StickerStore(args.db)
+            store.put_rows(multilingual_data)
+            store.close()
+            print(f"🗄️ Merged {len(multilingual_data)} triggers into '{args.db}'. Restart the bot to pick them up.")
+        else:
+            print("👉 Rename this file to 'stickers.csv' and upload it to GitHub!")
+    print(f"⏱️ Done in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
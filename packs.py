@@ -0,0 +1,135 @@
+import json
+import os
+import time
+from group_commit import file_lock
+from trigger_index import load_cached
+
+DEFAULT_PACK = "default"
+
+
+class PackRegistry:
+    """
+    Sticker packs by name, plus which pack (or fallback chain of packs) each chat uses.
+    A pack's CSV is only loaded and compiled the first time a chat actually needs it.
+    """
+
+    def __init__(self, cache_dir, chats_file=None):
+        self.cache_dir = cache_dir
+        self.chats_file = chats_file
+        self._paths = {}  # pack name -> CSV path
+        self._indexes = {}  # pack name -> TriggerIndex, filled on first use
+        self._chains = {}  # chat ID -> tuple of pack names, tried in order
+        self._broken = set()  # packs in chat_packs.json that are unknown or failed to load, reported once
+        self.last_checked = 0  # candidate triggers tested by the last search(), across packs
+        self.timed_out = False  # whether the last fuzzy_search() ran out of time
+        if chats_file and os.path.exists(chats_file):
+            with open(chats_file, mode="r", encoding="utf-8") as file:
+                self._chains = {int(chat_id): tuple(names) for chat_id, names in json.load(file).items()}
+
+    def add_pack(self, name, path):
+        self._paths[name] = path
+
+    def add_index(self, name, index):
+        """Registers an already loaded pack (e.g. the default one, which /addsticker writes to)."""
+        self._indexes[name] = index
+
+    def names(self):
+        return sorted(set(self._paths) | set(self._indexes))
+
+    def loaded(self):
+        return sorted(self._indexes)
+
+    def index(self, name):
+        """The pack's TriggerIndex, or the default pack's if it can't be loaded."""
+        index = self._indexes.get(name)
+        if index is None:
+            try:
+                index, from_snapshot = load_cached(self._paths[name], self.cache_dir)
+            except (KeyError, OSError) as e:
+                self._report_broken(name, e)
+                return self.index(DEFAULT_PACK)
+            self._indexes[name] = index
+            print(f"🎁 Loaded pack '{name}' ({len(index)} triggers, {'snapshot' if from_snapshot else 'built from CSV'})")
+        return index
+
+    def chain_for(self, chat_id):
+        """The chat's packs in fallback order, without removed or broken ones (the default pack if none are left)."""
+        chain = self._chains.get(chat_id)
+        if chain is None:
+            return (DEFAULT_PACK,)
+        usable = []
+        for name in chain:
+            if name in self._indexes or (name in self._paths and name not in self._broken):
+                usable.append(name)
+            else:
+                self._report_broken(name, KeyError(name))
+        return tuple(usable) or (DEFAULT_PACK,)
+
+    def _report_broken(self, name, error):
+        if name not in self._broken:
+            self._broken.add(name)
+            print(f"⚠️ Pack '{name}' is unavailable ({error!r}), using the default pack instead")
+
+    def set_chain(self, chat_id, names):
+        """Sets the packs a chat uses, in fallback order. Raises KeyError for unknown packs."""
+        known = self.names()
+        for name in names:
+            if name not in known:
+                raise KeyError(name)
+        if tuple(names) == (DEFAULT_PACK,):
+            self._chains.pop(chat_id, None)
+        else:
+            self._chains[chat_id] = tuple(names)
+        self._save(chat_id)
+
+    def search(self, chat_id, text):
+        """Returns the sticker ID from the first pack in the chat's chain that matches, or None."""
+        checked = 0
+        sticker_id = None
+        for name in self.chain_for(chat_id):
+            index = self.index(name)
+            sticker_id = index.search(text)
+            checked += index.last_checked
+            if sticker_id is not None:
+                break
+        self.last_checked = checked
+        return sticker_id
+
+    def fuzzy_search(self, chat_id, text, max_distance=1, budget=None):
+        """Like search(), but typo tolerant (see FuzzyIndex). Gives up after `budget` seconds, setting `timed_out`."""
+        chain = [self.index(name) for name in self.chain_for(chat_id)]
+        fuzzies = [index.fuzzy_index(max_distance) for index in chain]  # built before the clock starts
+        deadline = None if budget is None else time.perf_counter() + budget
+        checked = 0
+        sticker_id = None
+        self.timed_out = False
+        for index, fuzzy in zip(chain, fuzzies):
+            trigger = fuzzy.search(text, deadline)
+            checked += fuzzy.last_checked
+            if trigger is not None:
+                sticker_id = index.get(trigger)
+                break
+            if fuzzy.timed_out:
+                self.timed_out = True
+                break
+        self.last_checked = checked
+        return sticker_id
+
+    def _save(self, chat_id):
+        if not self.chats_file:
+            return
+        # Only this chat's entry is written over what is on disk: with shards.py, other
+        # worker processes own the other chats and save to the same file.
+        with file_lock(self.chats_file):
+            chains = {}
+            if os.path.exists(self.chats_file):
+                with open(self.chats_file, mode="r", encoding="utf-8") as file:
+                    chains = json.load(file)
+            if chat_id in self._chains:
+                chains[str(chat_id)] = list(self._chains[chat_id])
+            else:
+                chains.pop(str(chat_id), None)
+            tmp_path = f"{self.chats_file}.{os.getpid()}.tmp"
+            with open(tmp_path, mode="w", encoding="utf-8") as file:
+                json.dump(chains, file, indent=2)
+            os.replace(tmp_path, self.chats_file)
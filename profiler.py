@@ -0,0 +1,112 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf frames of threads that are just waiting (the event loop's select, idle pool workers),
+# left out of the hotspots but kept in the flamegraph
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread `interval` seconds apart from a background thread,
+    so the code being profiled runs unmodified. Nothing runs while it is stopped.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stacks = Counter()  # ("thread", "outer frame", ..., "leaf frame") -> samples
+        self._started = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Raises RuntimeError if it is already running."""
+        if self._thread is not None:
+            raise RuntimeError("profiler is already running")
+        self._stacks = Counter()
+        self._started = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and returns the Profile of the run."""
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        return Profile(self._stacks, time.monotonic() - self._started, self.interval)
+
+    def _sample(self):
+        own = threading.get_ident()
+        stacks = self._stacks
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stack.reverse()
+                stacks[tuple(stack)] += 1
+
+
+class Profile:
+    def __init__(self, stacks, seconds, interval):
+        self.stacks = stacks
+        self.seconds = seconds
+        self.interval = interval
+
+    def hotspots(self, limit=15):
+        """[(frame, self samples, total samples)] of the busiest functions, idle waits left out."""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            if _is_idle(stack[-1]):
+                continue
+            own[stack[-1]] += count
+            for frame in set(stack[1:]):  # a recursive function counts once per sample
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+    def busy_samples(self):
+        return sum(count for stack, count in self.stacks.items() if not _is_idle(stack[-1]))
+
+    def collapsed(self):
+        """The samples in the collapsed stack format flamegraph.pl and speedscope read."""
+        return "".join(
+            f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+    def report(self, limit=15):
+        busy = self.busy_samples()
+        lines = [
+            f"🔬 Profiled {self.seconds:.0f} s, {sum(self.stacks.values())} samples "
+            f"every {self.interval * 1000:g} ms, {busy} not idle"
+        ]
+        if not busy:
+            lines.append("Nothing but waiting, the bot was idle.")
+        for frame, own, total in self.hotspots(limit):
+            lines.append(f"{own / busy:6.1%} self {total / busy:6.1%} total  {frame}")
+        return "\n".join(lines)
+
+
+def _is_idle(frame):
+    name, _, where = frame.partition(" (")
+    return (where.split(":")[0], name) in IDLE_FRAMES
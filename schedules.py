@@ -0,0 +1,192 @@
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+import pytz
+from group_commit import file_lock
+
+
+class ScheduleStore:
+    """
+    Scheduled stickers, editable at runtime and saved to a JSON file: each schedule has a
+    local time, a sticker and any number of chats, and each chat can have its own time zone.
+    Delivery stats of every run are appended to `runs_file` as JSON lines.
+
+    Every edit re-reads the file and is saved under a lock, so shards sharing the file
+    only ever change what the edit touches, never each other's edits.
+    """
+
+    def __init__(self, path, default_timezone, runs_file=None):
+        self.path = path
+        self.default_timezone = default_timezone  # zone name, e.g. "Asia/Kolkata"
+        self.runs_file = runs_file
+        self.schedules = {}  # name -> {"time": "HH:MM", "sticker_id": str, "chats": [chat IDs]}
+        self.timezones = {}  # chat ID -> zone name, for chats not in the default zone
+        self.last_runs = {}  # name -> stats of its last run in this process
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        """Re-reads the file if it changed on disk (edited by hand, or by another shard). Returns True if it did."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with open(self.path, mode="r", encoding="utf-8") as file:
+            data = json.load(file)
+        self.schedules = data.get("schedules", {})
+        self.timezones = {int(chat_id): zone for chat_id, zone in data.get("timezones", {}).items()}
+        self._mtime = mtime
+        return True
+
+    def seed(self, entries):
+        """Fills an empty store from (hour, minute, sticker_id, chat_id) tuples, one schedule per time and sticker."""
+        def change():
+            if self.schedules or os.path.exists(self.path):
+                return False
+            for h, m, sticker_id, chat_id in entries:
+                schedule = self.schedules.setdefault(
+                    f"sticker_{h}_{m}", {"time": f"{h:02d}:{m:02d}", "sticker_id": sticker_id, "chats": []}
+                )
+                if chat_id not in schedule["chats"]:
+                    schedule["chats"].append(chat_id)
+        return self._update(change)
+
+    def add(self, name, at, sticker_id):
+        """Adds or replaces a schedule (keeping its chats). Raises ValueError for a bad HH:MM time."""
+        hour, minute = parse_time(at)
+
+        def change():
+            chats = self.schedules.get(name, {}).get("chats", [])
+            self.schedules[name] = {"time": f"{hour:02d}:{minute:02d}", "sticker_id": sticker_id, "chats": chats}
+        self._update(change)
+
+    def remove(self, name):
+        """Raises KeyError for an unknown schedule."""
+        def change():
+            del self.schedules[name]
+        self._update(change)
+
+    def add_chat(self, name, chat_id):
+        """Raises KeyError for an unknown schedule."""
+        def change():
+            chats = self.schedules[name]["chats"]
+            if chat_id in chats:
+                return False
+            chats.append(chat_id)
+        self._update(change)
+
+    def remove_chat(self, name, chat_id):
+        """Raises KeyError for an unknown schedule."""
+        def change():
+            chats = self.schedules[name]["chats"]
+            if chat_id not in chats:
+                return False
+            chats.remove(chat_id)
+        self._update(change)
+
+    def timezone_for(self, chat_id):
+        return self.timezones.get(chat_id, self.default_timezone)
+
+    def set_timezone(self, chat_id, zone):
+        """Raises pytz.UnknownTimeZoneError for an unknown zone name."""
+        pytz.timezone(zone)
+
+        def change():
+            if zone == self.default_timezone:
+                self.timezones.pop(chat_id, None)
+            else:
+                self.timezones[chat_id] = zone
+        self._update(change)
+
+    def targets(self, name, owns=None):
+        """The schedule's chats grouped by time zone: {zone name: [chat IDs]}. `owns` filters chats (for shards)."""
+        by_zone = {}
+        for chat_id in self.schedules.get(name, {}).get("chats", []):
+            if owns is None or owns(chat_id):
+                by_zone.setdefault(self.timezone_for(chat_id), []).append(chat_id)
+        return by_zone
+
+    def record_run(self, stats):
+        self.last_runs[stats["schedule"]] = stats
+        if not self.runs_file:
+            return
+        with open(self.runs_file, mode="a", encoding="utf-8") as file:
+            file.write(json.dumps(stats) + "\n")
+
+    def _update(self, change):
+        """
+        Runs `change()` on the latest state on disk and saves the result, all under the lock.
+        `change` may raise (nothing is saved) or return False for no change. Returns True if saved.
+        """
+        with file_lock(self.path):
+            self._mtime = None
+            self.reload()
+            if change() is False:
+                return False
+            self._save()
+            return True
+
+    def _save(self):
+        data = {
+            "schedules": self.schedules,
+            "timezones": {str(chat_id): zone for chat_id, zone in self.timezones.items()},
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+
+def parse_time(text):
+    """'9:30' -> (9, 30). Raises ValueError."""
+    try:
+        hour, minute = (int(part) for part in text.split(":"))
+    except ValueError:
+        raise ValueError(f"not a time of day: {text}") from None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"not a time of day: {text}")
+    return hour, minute
+
+
+async def fan_out(send, chat_ids, batch_size=50, pause=1.0, jitter=0.0, rng=random):
+    """
+    Calls `send(chat_id)` (returning an awaitable) for every chat, `batch_size` at a time,
+    waiting for each batch to finish and then `pause` seconds before the next one, after a
+    random start delay of up to `jitter` seconds. Returns (sent, failed) counts.
+    """
+    if jitter > 0:
+        await asyncio.sleep(rng.uniform(0, jitter))
+    chat_ids = list(chat_ids)
+    rng.shuffle(chat_ids)  # no chat is always last
+    sent = failed = 0
+    for start in range(0, len(chat_ids), batch_size):
+        if start:
+            await asyncio.sleep(pause)
+        results = await asyncio.gather(
+            *(send(chat_id) for chat_id in chat_ids[start:start + batch_size]), return_exceptions=True
+        )
+        for chat_id, result in zip(chat_ids[start:start + batch_size], results):
+            if isinstance(result, Exception):
+                failed += 1
+                print(f"❌ Failed to send scheduled sticker to {chat_id}: {result}")
+            else:
+                sent += 1
+    return sent, failed
+
+
+def run_stats(name, zone, chats, sent, failed, started):
+    return {
+        "schedule": name,
+        "timezone": zone,
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "chats": chats,
+        "sent": sent,
+        "failed": failed,
+        "seconds": round(time.monotonic() - started, 2),
+    }
@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import timedelta
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+# Lower number = sent first
+INTERACTIVE = 0
+BROADCAST = 1
+
+
+class SendDropped(Exception):
+    """The send was given up on: the queue was full or it ran out of retries."""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.paused_until = 0.0  # set from a 429's retry_after
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def idle(self, now):
+        """True once the bucket has refilled, i.e. it is no different from a new one."""
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.burst
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "send", "future", "enqueued", "not_before", "attempts")
+
+    def __init__(self, priority, seq, chat_id, send, future, now):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.send = send
+        self.future = future
+        self.enqueued = now
+        self.not_before = now
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendScheduler:
+    """
+    Outbound queue for Bot API calls, paced by a global token bucket and one per chat.
+    Interactive replies go out before scheduled broadcasts. A 429 pauses the chat for
+    `retry_after` seconds and the send is retried; network errors are retried with
+    exponential backoff up to `max_retries` times. Anything else fails straight away.
+
+    `submit()` takes a zero-argument function returning the API coroutine (so it can be
+    called again on retry) and returns a future with the API result.
+    """
+
+    MAX_CHAT_BUCKETS = 10_000
+
+    def __init__(
+        self,
+        global_rate=25.0,
+        chat_rate=20 / 60,
+        chat_burst=3,
+        max_queue=1000,
+        max_retries=3,
+        max_backoff=30.0,
+        clock=time.monotonic,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.clock = clock
+
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats = {}  # chat ID -> TokenBucket
+        self._queue = []  # heap of _Job
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self._in_flight = set()
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.wait_total = 0.0  # time queued before the successful attempt
+        self.wait_max = 0.0
+        # Optional hook called as observe(priority, outcome, wait, duration) when a send finishes
+        self.observe = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    async def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for job in self._queue:
+            job.future.cancel()
+        self._queue.clear()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def submit(self, send, chat_id, priority=INTERACTIVE):
+        future = asyncio.get_running_loop().create_future()
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            if self.observe is not None:
+                self.observe(priority, "dropped", 0.0, 0.0)
+            future.set_exception(SendDropped("send queue is full"))
+            return future
+        heapq.heappush(self._queue, _Job(priority, next(self._seq), chat_id, send, future, self.clock()))
+        self._wakeup.set()
+        return future
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "wait_avg": self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                self._chats = {key: old for key, old in self._chats.items() if not old.idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _next_ready(self, now):
+        """Pops the best job that may be sent now, or returns (None, seconds to wait)."""
+        skipped = []
+        job = None
+        wait = None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            delay = max(candidate.not_before - now, self._chat_bucket(candidate.chat_id, now).delay(now))
+            if delay <= 0:
+                job = candidate
+                break
+            skipped.append(candidate)
+            wait = delay if wait is None else min(wait, delay)
+        for candidate in skipped:
+            heapq.heappush(self._queue, candidate)
+        return job, wait
+
+    async def _dispatch(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = self.clock()
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            job, wait = self._next_ready(now)
+            if job is None:
+                # Every queued chat is rate limited; sleep until the first one frees up or a new job arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.take(now)
+            self._chat_bucket(job.chat_id, now).take(now)
+            task = asyncio.create_task(self._send(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, job):
+        if job.future.done():  # caller gave up (e.g. cancelled)
+            return
+        started = self.clock()
+        try:
+            result = await job.send()
+        except RetryAfter as e:
+            self.rate_limited += 1
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            now = self.clock()
+            self._chat_bucket(job.chat_id, now).paused_until = now + retry_after
+            self._retry(job, e, now)
+        except (BadRequest, Forbidden) as e:
+            # NetworkError subclasses that retrying won't fix
+            self._fail(job, e, started)
+        except NetworkError as e:
+            now = self.clock()
+            job.not_before = now + min(self.max_backoff, 2 ** job.attempts)
+            self._retry(job, e, now)
+        except Exception as e:
+            self._fail(job, e, started)
+        else:
+            wait = started - job.enqueued
+            self.sent += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if self.observe is not None:
+                self.observe(job.priority, "sent", wait, self.clock() - started)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _fail(self, job, error, started):
+        self.failed += 1
+        if self.observe is not None:
+            self.observe(job.priority, "failed", started - job.enqueued, self.clock() - started)
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _retry(self, job, error, now):
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            self.dropped += 1
+            if self.observe is not None:
+                self.observe(job.priority, "dropped", now - job.enqueued, 0.0)
+            if not job.future.done():
+                job.future.set_exception(SendDropped(f"gave up after {self.max_retries} retries: {error}"))
+            return
+        self.retries += 1
+        heapq.heappush(self._queue, job)
+        self._wakeup.set()
@@ -0,0 +1,230 @@
+"""
+Runs the bot as several worker processes, each one handling a share of the chats.
+
+    SHARDS=4 python shards.py
+
+This front process gets the updates from Telegram (long polling, or the webhook with
+UPDATE_MODE=webhook) and forwards each one to worker `chat_id % SHARDS`. The workers are
+ordinary main.py processes in webhook mode on local ports (SHARD_BASE_PORT, +1, ...), so
+every update of a chat lands in the same worker, in order, and cooldowns stay local to it.
+The front process compiles the trigger snapshot once before starting them, so workers only
+map the snapshot file instead of each building the matcher. Workers that die are restarted.
+Triggers added with /addsticker in one worker reach the others within TRIGGER_SYNC_INTERVAL
+(see main.sync_triggers).
+"""
+import asyncio
+import json
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.httpserver import HTTPServer
+import metrics
+from trigger_index import load_cached
+from web import HealthHandler, MetricsHandler, SECRET_HEADER
+
+# Same settings as main.py, read from the same environment variables
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling")
+PORT = int(os.getenv("PORT", 3000))
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "https://api.telegram.org")
+STICKERS_DB = os.getenv("STICKERS_DB")
+ROOM_DEDUP_SCOPE = os.getenv("ROOM_DEDUP_SCOPE", "chat")
+STICKERS_FILE = "stickers.csv"
+TRIGGER_CACHE_DIR = ".trigger_cache"
+
+SHARDS = int(os.getenv("SHARDS", os.cpu_count() or 1))
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 3100))
+POLL_TIMEOUT = 30
+FORWARD_GIVE_UP = 60  # seconds to keep retrying a worker that is down before dropping the update
+
+FORWARDED = metrics.counter("forest_front_forwarded_total", "Updates forwarded to a worker", ("shard",))
+FORWARD_DROPPED = metrics.counter("forest_front_dropped_total", "Updates dropped because their worker stayed down")
+WORKER_RESTARTS = metrics.counter("forest_front_worker_restarts_total", "Workers restarted after exiting")
+
+
+def chat_id_of(update):
+    """The chat an update belongs to, for partitioning (the user for chat-less updates, else 0)."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+class Workers:
+    """The main.py worker processes, plus forwarding updates to them."""
+
+    def __init__(self, count, base_port):
+        self.count = count
+        self.ports = [base_port + shard for shard in range(count)]
+        self.secret = secrets.token_hex(16)  # only the front process may post to the workers
+        self.processes = [None] * count
+        self.client = AsyncHTTPClient()
+        self.stopping = False
+
+    def spawn(self, shard):
+        env = dict(
+            os.environ,
+            UPDATE_MODE="webhook",
+            PORT=str(self.ports[shard]),
+            WEBHOOK_SECRET=self.secret,
+            SHARD_INDEX=str(shard),
+            SHARD_COUNT=str(self.count),
+        )
+        env.pop("WEBHOOK_URL", None)  # the front process owns the webhook
+        self.processes[shard] = subprocess.Popen([sys.executable, "main.py"], env=env)
+
+    def start(self):
+        for shard in range(self.count):
+            self.spawn(shard)
+        print(f"🧩 Started {self.count} workers on ports {self.ports[0]}-{self.ports[-1]}")
+
+    async def supervise(self):
+        while not self.stopping:
+            for shard, process in enumerate(self.processes):
+                if process.poll() is not None and not self.stopping:
+                    print(f"⚠️ Worker {shard} exited with {process.returncode}, restarting")
+                    WORKER_RESTARTS.inc()
+                    self.spawn(shard)
+            await asyncio.sleep(1)
+
+    async def stop(self):
+        self.stopping = True
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            await asyncio.to_thread(process.wait)
+
+    async def forward(self, updates):
+        """Sends updates to their workers: in order within a worker, workers in parallel."""
+        by_shard = {}
+        for update in updates:
+            by_shard.setdefault(chat_id_of(update) % self.count, []).append(update)
+        await asyncio.gather(*(self._forward_all(shard, batch) for shard, batch in by_shard.items()))
+
+    async def _forward_all(self, shard, updates):
+        for update in updates:
+            await self._forward(shard, update)
+
+    async def _forward(self, shard, update):
+        url = f"http://127.0.0.1:{self.ports[shard]}{WEBHOOK_PATH}"
+        body = json.dumps(update)
+        give_up = time.monotonic() + FORWARD_GIVE_UP
+        delay = 0.1
+        while True:
+            try:
+                await self.client.fetch(
+                    url, method="POST", body=body,
+                    headers={"Content-Type": "application/json", SECRET_HEADER: self.secret},
+                )
+                FORWARDED.inc(str(shard))
+                return
+            except (HTTPClientError, OSError) as e:
+                # Usually a worker that is still starting or being restarted
+                if self.stopping or time.monotonic() > give_up:
+                    FORWARD_DROPPED.inc()
+                    print(f"❌ Dropped update {update.get('update_id')} for worker {shard}: {e}")
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5)
+
+
+class FrontWebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, workers, secret_token):
+        self.workers = workers
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token and self.request.headers.get(SECRET_HEADER) != self.secret_token:
+            raise tornado.web.HTTPError(403)
+        try:
+            update = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "body is not JSON")
+        await self.workers.forward([update])
+
+
+async def call_api(client, method, params, timeout=10):
+    response = await client.fetch(
+        f"{BOT_API_BASE_URL.rstrip('/')}/bot{BOT_TOKEN}/{method}",
+        method="POST",
+        body=json.dumps(params),
+        headers={"Content-Type": "application/json"},
+        request_timeout=timeout,
+    )
+    return json.loads(response.body)["result"]
+
+
+async def poll(workers, stop):
+    """Long polls getUpdates and only confirms a batch once every update in it was forwarded."""
+    await call_api(workers.client, "deleteWebhook", {})
+    offset = 0
+    while not stop.is_set():
+        try:
+            updates = await call_api(workers.client, "getUpdates", {"offset": offset, "timeout": POLL_TIMEOUT}, POLL_TIMEOUT + 10)
+        except (HTTPClientError, OSError, ValueError, KeyError) as e:
+            print(f"⚠️ getUpdates failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        if updates:
+            await workers.forward(updates)
+            offset = updates[-1]["update_id"] + 1
+
+
+async def run():
+    if ROOM_DEDUP_SCOPE == "global":
+        # Workers only see their own chats, they can't tell a room was posted in another worker's
+        print("❌ Error: ROOM_DEDUP_SCOPE=global doesn't work with shards, use chat.")
+        sys.exit(1)
+    if not STICKERS_DB:
+        # Workers find the compiled snapshot ready and just map it
+        index, from_snapshot = load_cached(STICKERS_FILE, TRIGGER_CACHE_DIR)
+        print(f"📦 Trigger snapshot ready ({len(index)} triggers, {'cached' if from_snapshot else 'built'})")
+
+    workers = Workers(SHARDS, SHARD_BASE_PORT)
+    workers.start()
+    routes = [(r"/", HealthHandler), (r"/metrics", MetricsHandler)]
+    if UPDATE_MODE == "webhook":
+        routes.append((WEBHOOK_PATH, FrontWebhookHandler, {"workers": workers, "secret_token": WEBHOOK_SECRET}))
+    server = HTTPServer(tornado.web.Application(routes))
+    server.listen(PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    supervisor = asyncio.create_task(workers.supervise())
+
+    print(f"🤖 Front process is running ({UPDATE_MODE}, {SHARDS} workers)...")
+    if UPDATE_MODE == "webhook":
+        if WEBHOOK_URL:
+            params = {"url": WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH}
+            if WEBHOOK_SECRET:
+                params["secret_token"] = WEBHOOK_SECRET
+            await call_api(workers.client, "setWebhook", params)
+        await stop.wait()
+    else:
+        poller = asyncio.create_task(poll(workers, stop))
+        await stop.wait()
+        poller.cancel()
+
+    server.stop()
+    await workers.stop()
+    supervisor.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import csv
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stickers (
+    sticker_id TEXT PRIMARY KEY,
+    tree_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS stickers_tree_id ON stickers (tree_id);
+
+CREATE TABLE IF NOT EXISTS triggers (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- load order, breaks priority ties like CSV row order
+    trigger TEXT NOT NULL UNIQUE,
+    sticker_id TEXT NOT NULL REFERENCES stickers (sticker_id),
+    lang TEXT
+);
+CREATE INDEX IF NOT EXISTS triggers_sticker_id ON triggers (sticker_id);
+CREATE INDEX IF NOT EXISTS triggers_lang ON triggers (lang);
+"""
+
+
+class StickerStore:
+    """
+    SQLite sticker database (WAL mode), an alternative to stickers.csv.
+    Every write is its own transaction, so an /addsticker is durable without
+    rewriting or re-reading anything, and lookups go through indexes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # The bot hands the connection to a single worker thread, so it is never shared at once
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM triggers").fetchone()[0]
+
+    def rows(self):
+        """(trigger, sticker_id) pairs in load order, ready for TriggerIndex."""
+        return self.conn.execute("SELECT trigger, sticker_id FROM triggers ORDER BY seq").fetchall()
+
+    def last_seq(self):
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM triggers").fetchone()[0]
+
+    def rows_after(self, seq):
+        """(trigger, sticker_id) pairs added after `seq` (e.g. by another process), and the last seq."""
+        rows = self.conn.execute(
+            "SELECT seq, trigger, sticker_id FROM triggers WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        return [(trigger, sticker_id) for _, trigger, sticker_id in rows], rows[-1][0] if rows else seq
+
+    def add_trigger(self, trigger, sticker_id, lang=None, tree_id=None):
+        """Adds a new trigger. Returns False if it already exists."""
+        with self.conn:
+            self._put_sticker(sticker_id, tree_id)
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO triggers (trigger, sticker_id, lang) VALUES (?, ?, ?)",
+                (trigger, sticker_id, lang),
+            )
+        return cursor.rowcount == 1
+
+    def put_rows(self, rows):
+        """
+        Upserts (trigger, sticker_id[, tree_id, lang]) rows in one transaction.
+        A repeated trigger keeps its position but takes the newer sticker, like the CSV loader.
+        """
+        with self.conn:
+            for row in rows:
+                trigger, sticker_id = row[0], row[1]
+                tree_id = row[2] if len(row) > 2 else None
+                lang = row[3] if len(row) > 3 else None
+                self._put_sticker(sticker_id, tree_id)
+                self.conn.execute(
+                    "INSERT INTO triggers (trigger, sticker_id, lang) VALUES (?, ?, ?) "
+                    "ON CONFLICT (trigger) DO UPDATE SET "
+                    "sticker_id = excluded.sticker_id, lang = COALESCE(excluded.lang, lang)",
+                    (trigger, sticker_id, lang),
+                )
+
+    def import_csv(self, path):
+        """Loads a `trigger,sticker_id` CSV. Returns the number of rows read."""
+        with open(path, mode="r", encoding="utf-8") as file:
+            rows = [(row[0].strip(), row[1].strip()) for row in csv.reader(file) if len(row) == 2]
+        self.put_rows(rows)
+        return len(rows)
+
+    def export_csv(self, file):
+        """Writes `trigger,sticker_id` rows to an open text file, in load order."""
+        writer = csv.writer(file)
+        writer.writerows(self.rows())
+
+    def _put_sticker(self, sticker_id, tree_id):
+        self.conn.execute(
+            "INSERT INTO stickers (sticker_id, tree_id) VALUES (?, ?) "
+            "ON CONFLICT (sticker_id) DO UPDATE SET tree_id = COALESCE(excluded.tree_id, tree_id)",
+            (sticker_id, tree_id),
+        )
@@ -0,0 +1,60 @@
+import csv
+import pytest
+import merge_langs
+
+# The Arabic name conflict from name_conflict.md: one name for two different trees
+MASTER_LIST = """ID,Key,default,values-ar,values-ja
+1,white_rose,White Rose,وردة بيضاء,白いバラ
+2,rainbow_flower,Rainbow Flower,وردة بيضاء,虹の花
+3,cedar,Cedar,أرز,杉
+"""
+
+
+def write_files(folder, stickers):
+    (folder / "forest_master_list.csv").write_text(MASTER_LIST, encoding="utf-8")
+    (folder / "stickers.csv").write_text(stickers, encoding="utf-8")
+
+
+def read_rows(path):
+    with open(path, encoding="utf-8", newline="") as file:
+        return list(csv.reader(file))
+
+
+def test_incremental_merge_with_a_name_conflict(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, "white rose,S1\nrainbow flower,S2\n")
+
+    merge_langs.main(["--incremental", "--apply"])
+    rows = read_rows(tmp_path / "stickers.csv")
+    assert ["وردة بيضاء", "S1"] in rows  # the first tree keeps the shared name
+    assert ["وردة بيضاء", "S2"] not in rows
+
+    # Only the new tree is merged on the next run
+    with open(tmp_path / "stickers.csv", "a", encoding="utf-8") as file:
+        file.write("cedar,S3\n")
+    _, trees, skipped = merge_langs.merge_files(
+        "forest_master_list.csv", merge_langs.load_stickers_map("stickers.csv"),
+        merge_langs.load_merge_state("merge_state.json"),
+    )
+    assert skipped == 2
+    assert len(trees) == 3
+
+    merge_langs.main(["--incremental", "--apply"])
+    rows = read_rows(tmp_path / "stickers.csv")
+    assert ["أرز", "S3"] in rows and ["杉", "S3"] in rows
+    assert ["وردة بيضاء", "S2"] not in rows
+
+
+def test_missing_database_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, "white rose,S1\n")
+    with pytest.raises(SystemExit):
+        merge_langs.main(["--db", "stickers.db"])
+    assert not (tmp_path / "stickers.db").exists()
+    assert not (tmp_path / "stickers_final.csv").exists()
+
+
+def test_apply_needs_incremental(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        merge_langs.main(["--apply"])
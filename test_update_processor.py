@@ -0,0 +1,33 @@
+import asyncio
+import types
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def update_in(chat_id):
+    return types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=chat_id))
+
+
+def test_flood_in_one_chat_does_not_hold_up_another():
+    async def run():
+        processor = ChatOrderedUpdateProcessor(4)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        finished = {}
+
+        async def handle(name, seconds):
+            await asyncio.sleep(seconds)
+            finished[name] = loop.time() - started
+
+        tasks = [
+            asyncio.create_task(processor.process_update(update_in(1), handle(f"flood {i}", 0.1)))
+            for i in range(6)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(update_in(2), handle("other chat", 0.01))))
+        await asyncio.gather(*tasks)
+        return processor, finished
+
+    processor, finished = asyncio.run(run())
+    assert processor.max_concurrent_updates == 4
+    assert finished["other chat"] < 0.05
+    assert finished["flood 5"] >= 0.6  # still one at a time within chat 1
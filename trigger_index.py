@@ -0,0 +1,286 @@
+import csv
+import hashlib
+import io
+import marshal
+import mmap
+import os
+import sys
+import conflicts
+from fuzzy import FuzzyIndex
+from matcher import ScriptMatcher, fold
+
+# Bump whenever the layout of TriggerIndex.to_state() changes
+SNAPSHOT_FORMAT = 4
+
+
+class TriggerIndex:
+    """
+    In-memory trigger table: trigger -> sticker ID, plus the matcher built from it.
+    Adds and removes are plain dict operations. After a change, search() keeps using the
+    previous matcher until a new one is compiled (compile(), or a copy() compiled in
+    another thread and handed back with adopt_matcher()), so no search waits on a rebuild
+    and a batch of adds costs a single one. Only the first search builds it if nothing did.
+
+    Each sticker ID (the same file_id repeats once per language) is stored once in a
+    table, and triggers refer to it by its position there. The IDs are interned, so
+    packs sharing a sticker share the string too.
+    """
+
+    def __init__(self, rows=()):
+        self._stickers = {}  # trigger -> position in _sticker_ids, in load order
+        self._sticker_ids = []  # IDs only used by removed triggers stay until the next load
+        self._sticker_refs = {}  # sticker ID -> position in _sticker_ids
+        self._changes = 0
+        self._matcher = None
+        self._matcher_changes = 0  # _changes when _matcher was built
+        self._fuzzy = None  # FuzzyIndex, only built once fuzzy matching is used
+        for trigger, sticker_id in rows:
+            self._put(trigger, sticker_id)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Loads `trigger,sticker_id` rows. Raises FileNotFoundError if path is missing."""
+        with open(path, mode="r", encoding="utf-8") as file:
+            return cls(_parse_rows(file))
+
+    @classmethod
+    def from_state(cls, state):
+        _, triggers, refs, sticker_ids, matcher_state = state
+        index = cls()
+        index._stickers = dict(zip(triggers, refs))
+        index._sticker_ids = [sys.intern(sticker_id) for sticker_id in sticker_ids]
+        index._sticker_refs = {sticker_id: ref for ref, sticker_id in enumerate(index._sticker_ids)}
+        index._matcher = ScriptMatcher.from_state(matcher_state)
+        return index
+
+    def to_state(self):
+        """Snapshot of the table and its compiled matcher, see load_cached()."""
+        return (
+            SNAPSHOT_FORMAT,
+            list(self._stickers),
+            list(self._stickers.values()),
+            self._sticker_ids,
+            self.compile().to_state(),
+        )
+
+    def __len__(self):
+        return len(self._stickers)
+
+    def __contains__(self, trigger):
+        return trigger in self._stickers
+
+    def get(self, trigger, default=None):
+        ref = self._stickers.get(trigger)
+        return default if ref is None else self._sticker_ids[ref]
+
+    def items(self):
+        """(trigger, sticker_id) pairs in matching priority order."""
+        return [(trigger, self._sticker_ids[self._stickers[trigger]]) for trigger in self._ranked()]
+
+    def add(self, trigger, sticker_id):
+        """Adds a new trigger. Returns False if it already exists."""
+        if trigger in self._stickers:
+            return False
+        self._put(trigger, sticker_id)
+        return True
+
+    def remove(self, trigger):
+        """Removes a trigger. Returns False if it didn't exist."""
+        if trigger not in self._stickers:
+            return False
+        del self._stickers[trigger]
+        self._changes += 1
+        self._fuzzy = None
+        return True
+
+    def search(self, text):
+        """Returns the sticker ID for the best trigger in text, or None. See the class docstring after changes."""
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self.compile()
+        # A trigger removed since the matcher was built has no sticker any more
+        trigger = matcher.search(text)
+        return None if trigger is None else self.get(trigger)
+
+    @property
+    def compiled(self):
+        """True if the matcher is up to date with the triggers."""
+        return self._matcher is not None and self._matcher_changes == self._changes
+
+    def compile(self):
+        """Builds the matcher for the current triggers now, unless it is up to date, and returns it."""
+        if not self.compiled:
+            changes = self._changes
+            self._matcher = ScriptMatcher(self._live())
+            self._matcher_changes = changes
+        return self._matcher
+
+    def fuzzy_index(self, max_distance=1):
+        """The typo tolerant FuzzyIndex of the current triggers, built on first use."""
+        fuzzy = self._fuzzy
+        if fuzzy is None or fuzzy.max_distance != max_distance:
+            fuzzy = self._fuzzy = FuzzyIndex(self._live(), max_distance)
+        return fuzzy
+
+    def has_fuzzy_index(self, max_distance=1):
+        return self._fuzzy is not None and self._fuzzy.max_distance == max_distance
+
+    @property
+    def last_checked(self):
+        """Candidate triggers tested by the last search()."""
+        return self._matcher.last_checked if self._matcher is not None else 0
+
+    def copy(self):
+        """
+        The same table without its matcher, to build one in another thread (which must not
+        read this index while it may change) and adopt_matcher() it back. Call it from the
+        thread that changes this index.
+        """
+        other = TriggerIndex()
+        other._stickers = dict(self._stickers)
+        other._sticker_ids = list(self._sticker_ids)
+        other._sticker_refs = dict(self._sticker_refs)
+        other._changes = self._changes
+        return other
+
+    def adopt_matcher(self, other):
+        """
+        Takes over the matcher and fuzzy index of an index built from the same rows (e.g. a
+        copy() compiled in a background thread), unless this one has up to date ones already
+        or changed since. Call it from the thread that changes this index.
+        """
+        if other._changes != self._changes:
+            return
+        if not self.compiled and other.compiled:
+            self._matcher = other._matcher
+            self._matcher_changes = self._changes
+        if self._fuzzy is None and other._fuzzy is not None:
+            self._fuzzy = other._fuzzy
+
+    def _put(self, trigger, sticker_id):
+        # A repeated trigger keeps its original position (dicts keep it on update) but
+        # takes the newer sticker, same as building a dict from the CSV rows.
+        sticker_id = sys.intern(sticker_id)
+        ref = self._sticker_refs.get(sticker_id)
+        if ref is None:
+            ref = self._sticker_refs[sticker_id] = len(self._sticker_ids)
+            self._sticker_ids.append(sticker_id)
+        self._stickers[trigger] = ref
+        self._changes += 1
+        self._fuzzy = None
+
+    def _ranked(self):
+        # Longest trigger first, load order among equal lengths (the sort is stable)
+        return sorted(self._stickers, key=len, reverse=True)
+
+    def _live(self):
+        # Triggers that casefold to the same text as a higher ranked one (or to nothing)
+        # can never win, so the matcher doesn't get them. See conflicts.analyze().
+        live = []
+        seen = set()
+        for trigger in self._ranked():
+            word = fold(trigger)
+            if word and word not in seen:
+                seen.add(word)
+                live.append(trigger)
+        return live
+
+
+def _parse_rows(file):
+    return [(row[0].strip(), row[1].strip()) for row in csv.reader(file) if len(row) == 2]
+
+
+def read_appended(path, offset):
+    """
+    Rows appended to a trigger CSV after byte `offset` (e.g. by another worker), and the offset
+    to continue from. A last line without its newline is an append in progress, left for the
+    next call. A file that got shorter was rewritten, so it is read from the start again.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < offset:
+            offset = 0
+        file.seek(offset)
+        data = file.read()
+    end = data.rfind(b"\n") + 1
+    return _parse_rows(io.StringIO(data[:end].decode("utf-8"), newline="")), offset + end
+
+
+def load_cached(path, cache_dir=".trigger_cache"):
+    """
+    Loads a trigger CSV through a compiled snapshot stored in `cache_dir`.
+    Snapshots are keyed by the SHA-256 of the CSV, so editing the file (or an
+    /addsticker append) simply produces a new one on the next start.
+    Returns (index, from_snapshot). Raises FileNotFoundError if path is missing.
+    """
+    index, finish = load_deferred(path, cache_dir)
+    if finish is None:
+        return index, True
+    index.adopt_matcher(finish())
+    return index, False
+
+
+def load_deferred(path, cache_dir=".trigger_cache"):
+    """
+    Like load_cached(), but without a snapshot it returns as soon as the CSV is read and
+    leaves compiling the matcher, writing the snapshot and the conflict report to the
+    returned `finish()`, e.g. for a background thread once the bot is polling. It works on
+    its own copy of the index and returns it, for `index.adopt_matcher()`. A search
+    before that simply builds the matcher itself.
+    Returns (index, finish), finish is None if the snapshot was used.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    snapshot_path = os.path.join(cache_dir, f"{stem}-{digest}.snap")
+
+    try:
+        with open(snapshot_path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                state = marshal.loads(view)
+        if state[0] == SNAPSHOT_FORMAT:
+            return TriggerIndex.from_state(state), None
+    except FileNotFoundError:
+        pass
+    except (ValueError, EOFError, TypeError, IndexError) as e:
+        print(f"⚠️ Ignoring unreadable snapshot {snapshot_path}: {e}")
+
+    rows = _parse_rows(io.StringIO(data.decode("utf-8"), newline=""))
+    index = TriggerIndex(rows)
+
+    def finish():
+        # As in the CSV, even if /addsticker changed `index` meanwhile
+        built = TriggerIndex(rows)
+        try:
+            _save_snapshot(built, cache_dir, stem, snapshot_path)
+        except OSError as e:
+            print(f"⚠️ Could not write trigger snapshot: {e}")
+
+        # Only when the CSV changed, like the snapshot itself
+        report = conflicts.analyze(rows)
+        report_path = os.path.join(cache_dir, f"{stem}-conflicts.json")
+        try:
+            conflicts.save_report(report, report_path)
+        except OSError as e:
+            print(f"⚠️ Could not write conflict report: {e}")
+        message = conflicts.summary(report)
+        if message:
+            print(f"⚠️ {path}: {message} (details in {report_path})")
+        return built
+
+    return index, finish
+
+
+def _save_snapshot(index, cache_dir, stem, snapshot_path):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        marshal.dump(index.to_state(), file)
+    os.replace(tmp_path, snapshot_path)
+
+    # Only the latest snapshot of each CSV is worth keeping
+    for name in os.listdir(cache_dir):
+        old_path = os.path.join(cache_dir, name)
+        if name.startswith(f"{stem}-") and name.endswith(".snap") and old_path != snapshot_path:
+            os.remove(old_path)
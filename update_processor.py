@@ -0,0 +1,53 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Handles updates from different chats concurrently, at most `max_concurrent_updates`
+    at a time, while updates from the same chat still run one after another in the
+    order they arrived (so cooldown checks and conversations stay consistent).
+
+    The concurrency limit is applied after the per-chat lock, so a flood in one chat
+    waits on its own lock instead of holding every slot. The base class semaphore only
+    bounds how many updates may be waiting at once (`max_pending_updates`).
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending_updates=4096):
+        # The base class sizes its semaphore from max_concurrent_updates, so the property
+        # below only reports the real limit once that semaphore is created
+        self._limit = None
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chats = {}  # chat ID -> [lock, number of updates using it]
+
+    @property
+    def max_concurrent_updates(self):
+        return self._limit or self._max_concurrent_updates
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._chats.get(chat.id)
+        if entry is None:
+            entry = self._chats[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
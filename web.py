@@ -0,0 +1,49 @@
+import json
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Update
+from metrics import REGISTRY
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("Bot is alive!")
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(REGISTRY.render())
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Receives updates from Telegram (or a local curl) and queues them for the Application."""
+
+    def initialize(self, bot_app, secret_token):
+        # `self.application` is tornado's own app, hence the different name
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token and self.request.headers.get(SECRET_HEADER) != self.secret_token:
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "body is not JSON")
+        await self.bot_app.update_queue.put(Update.de_json(data, self.bot_app.bot))
+
+
+def start_server(bot_app, port, webhook_path=None, secret_token=None):
+    """
+    Serves the health check and /metrics (and the webhook route, if given) on the running asyncio loop,
+    next to the Application instead of on a separate thread. Must be called from inside the loop.
+    """
+    routes = [(r"/", HealthHandler), (r"/metrics", MetricsHandler)]
+    if webhook_path:
+        routes.append((webhook_path, WebhookHandler, {"bot_app": bot_app, "secret_token": secret_token}))
+    server = HTTPServer(tornado.web.Application(routes))
+    server.listen(port)
+    return server